@@ -1,9 +1,24 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
+from redis import asyncio as aioredis
+import aiofiles
+import orjson
+from pathlib import Path
+import asyncio
+import faulthandler
+import hashlib
+import logging
 import sys
 import os
 from dotenv import load_dotenv
@@ -11,19 +26,61 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# Route application logs through the root logger (uvicorn propagates to it as well)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Dump native tracebacks on hard crashes (segfaults, aborts) in the server or its workers
+faulthandler.enable()
+
 # Add project root to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
 
-from database.supabase_manager import supabase_manager
-from src.preprocessor.json_context_extractor import JSONContextExtractor
+from database.supabase_manager import get_supabase
+from database.postgres_pool import db_pool
+from src.preprocessor.json_context_extractor import JSONContextExtractor, init_extraction_worker, process_json_sync
+
+# Worker processes for extraction runs, so parsing and deduplication
+# don't hold up the event loop serving other requests (opened by the lifespan handler)
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    global _extraction_pool
+    await db_pool.connect()
+
+    # Spawned (not forked) workers so they never inherit the server's threads or
+    # HTTP connections; each builds its own extractor and Supabase client
+    _extraction_pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_extraction_worker
+    )
+
+    # Dashboard response cache - Redis when configured, in-process otherwise
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        FastAPICache.init(RedisBackend(aioredis.from_url(redis_url)), prefix="mem-api")
+    else:
+        FastAPICache.init(InMemoryBackend(), prefix="mem-api")
+
+    yield
+    await db_pool.close()
+    _extraction_pool.shutdown(wait=False, cancel_futures=True)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Memory System API",
     description="API for managing user memory extraction and review",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -51,14 +108,21 @@ if os.path.exists("frontend"):
     if os.path.exists("frontend/build"):
         print(f"🔍 Frontend/build directory contents: {os.listdir('frontend/build')}")
 
+class CachedStaticFiles(StaticFiles):
+    """Static files with long-lived caching - CRA build assets are content-hashed"""
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
 if os.path.exists(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+    app.mount("/static", CachedStaticFiles(directory=static_dir, follow_symlink=False), name="static")
     print(f"✅ Static files mounted from {static_dir}")
 else:
     print(f"❌ Static directory not found: {static_dir}")
 
 # Global instances
-# Note: Supabase manager is initialized in supabase_manager.py
+# Note: Supabase manager is created lazily by get_supabase() in supabase_manager.py
 extractor = JSONContextExtractor()
 
 # Pydantic models
@@ -66,6 +130,10 @@ class UpdateAction(BaseModel):
     action: str  # "approve" or "reject"
     reviewed_by: str = "ops_user"
 
+class BulkUpdateAction(BaseModel):
+    update_ids: List[str]
+    reviewed_by: str = "ops_user"
+
 class ConcludedFact(BaseModel):
     id: str  # Changed from int to str to accept UUID strings
     user_id: str
@@ -86,83 +154,84 @@ class UserSummary(BaseModel):
     rejected_nodes: int
     layers: Dict[str, int]  # Changed from Dict[str, Dict[str, Any]] to Dict[str, int]
 
-def format_concluded_fact(node: Dict) -> str:
-    """Convert raw extracted data into human-readable concluded facts"""
-    try:
-        user_id = node.get('user_id', 'Unknown User')
-        node_type = node.get('node_type', 'unknown')
-        
-        # Handle different possible value structures
-        if 'value' in node:
-            if isinstance(node['value'], dict):
-                value = node['value'].get('value', 'N/A')
-            else:
-                value = str(node['value'])
-        elif 'raw_value' in node:
-            value = str(node['raw_value'])
-        else:
-            value = 'N/A'
-            print(f"⚠️  Warning: No value field found in node: {node}")
-    except Exception as e:
-        print(f"❌ Error in format_concluded_fact: {str(e)}")
-        print(f"❌ Node structure: {node}")
-        return f"Error formatting fact: {str(e)}"
-    
-    # Format different types of facts
-    fact_templates = {
-        'name': f"Full name of {user_id} is {value}",
-        'phone': f"Phone number of {user_id} is {value}",
-        'email': f"Email address of {user_id} is {value}",
-        'address': f"Address of {user_id} is {value}",
-        'age': f"Age of {user_id} is {value} years old",
-        'dob': f"Date of birth of {user_id} is {value}",
-        'nationality': f"Nationality of {user_id} is {value}",
-        'gender': f"Gender of {user_id} is {value}",
-        'blood_group': f"Blood group of {user_id} is {value}",
-        'relationship_status': f"Relationship status of {user_id} is {value}",
-        
-        # ID documents
-        'aadhaar_number': f"Aadhaar number of {user_id} is {value}",
-        'pan_number': f"PAN number of {user_id} is {value}",
-        'license_number': f"Driving license number of {user_id} is {value}",
-        'voter_id': f"Voter ID of {user_id} is {value}",
-        'document_type': f"{user_id} has shared {value} document",
-        'age': f"Age of {user_id} is {value} years old",
-        'dob': f"Date of birth of {user_id} is {value}",
-        'nationality': f"Nationality of {user_id} is {value}",
-        'gender': f"Gender of {user_id} is {value}",
-        'blood_group': f"Blood group of {user_id} is {value}",
-        'relationship_status': f"Relationship status of {user_id} is {value}",
-        
-        # Layer 2 - Documents
-        'aadhaar_number': f"Aadhaar number of {user_id} is {value}",
-        'pan_number': f"PAN number of {user_id} is {value}",
-        'license_number': f"Driving license number of {user_id} is {value}",
-        'voter_id': f"Voter ID of {user_id} is {value}",
-        'document_type': f"{user_id} has shared {value} document",
-        
-        # Layer 3 - Relations
-        'family_member': f"{value} is a family member of {user_id}",
-        'spouse': f"{value} is the spouse of {user_id}",
-        'spouse_name': f"{user_id}'s spouse is {value}",
-        'spouse_phone': f"{user_id}'s spouse's phone number is {value}",
-        'spouse_email': f"{user_id}'s spouse's email is {value}",
-        'friend': f"{value} is a friend of {user_id}",
-        'colleague': f"{value} is a colleague of {user_id}",
-        'contact_name': f"{value} is a contact of {user_id}",
-        'relationship': f"{user_id} has relationship with {value}",
-        'contact_phone': f"Contact phone number for {user_id}'s relation is {value}",
-        
-        # Layer 4 - Preferences
-        'food_preference': f"{user_id} prefers {value} food",
-        'restaurant_preference': f"{user_id}'s preferred restaurant is {value}",
-        'service_provider': f"{user_id} uses {value} as service provider",
-        'vendor_name': f"{user_id}'s preferred vendor is {value}",
-        'routine': f"{user_id} has routine: {value}",
-        'standing_instruction': f"{user_id}'s standing instruction: {value}",
-    }
-    
-    return fact_templates.get(node_type, f"{user_id} has {node_type}: {value}")
+# Valid values of the `layer` query parameter
+_LAYER_MAP = {'Layer1': 1, 'Layer2': 2, 'Layer3': 3, 'Layer4': 4}
+
+def parse_layer(layer: Optional[str]) -> Optional[int]:
+    """Map a "LayerN" query parameter to its layer number, rejecting unknown values"""
+    if not layer:
+        return None
+    layer_num = _LAYER_MAP.get(layer)
+    if layer_num is None:
+        raise HTTPException(status_code=400, detail=f"Invalid layer '{layer}', expected one of {list(_LAYER_MAP)}")
+    return layer_num
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Weak If-None-Match comparison: "*" or any listed entity tag equal to etag, ignoring W/"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(','))
+    return any(tag.removeprefix('W/') == etag for tag in tags)
+
+def get_db():
+    """Read backend for the dashboard endpoints: the pooled Postgres connection
+    when SUPABASE_DB_URL is configured, otherwise the Supabase REST client"""
+    return db_pool if db_pool.is_connected() else get_supabase()
+
+def dashboard_cache_key(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+    """Cache key for dashboard reads - scoped per user where the route has one,
+    and independent of the injected db backend"""
+    user_id = (kwargs or {}).get("user_id", "all")
+    return f"{FastAPICache.get_prefix()}:{namespace}:{user_id}"
+
+# Bound concurrent input file reads to avoid exhausting file descriptors
+_FILE_READ_SEMAPHORE = asyncio.Semaphore(8)
+
+async def load_json_file(path) -> Any:
+    """Read and parse a JSON file without blocking the event loop"""
+    async with _FILE_READ_SEMAPHORE:
+        async with aiofiles.open(path, 'rb') as f:
+            return orjson.loads(await f.read())
+
+# Bound concurrent per-file extraction runs in the batch endpoint
+_PROCESS_SEMAPHORE = asyncio.Semaphore(8)
+
+async def run_extraction(json_data: Any, user_id: str, force_reprocess: bool) -> Dict:
+    """Run the extractor on one user's JSON in the extraction worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_extraction_pool, process_json_sync, json_data, user_id, force_reprocess)
+
+# Memory graphs with more facts than this are streamed rather than buffered
+_STREAM_MIN_FACTS = 500
+
+async def stream_concluded_facts(user_id: str, layer_num: Optional[int]):
+    """Yield a user's concluded facts as a JSON array, one encoded fact at a time"""
+    yield b'['
+    first = True
+    async for fact in db_pool.iter_user_memory_graph(user_id, layer_num):
+        if not first:
+            yield b','
+        first = False
+        yield orjson.dumps({
+            'id': fact['id'],
+            'user_id': user_id,
+            'layer': fact['layer'],
+            'fact_type': fact['fact_type'],
+            'conclusion': fact['conclusion'],
+            'confidence': fact['confidence'],
+            'evidence': fact['evidence'],
+            'status': fact['status'],
+            'created_at': fact['created_at'],
+            'raw_value': fact.get('content', 'N/A')
+        })
+    yield b']'
+
+async def invalidate_dashboard_cache():
+    """Drop cached dashboard reads after memory nodes change"""
+    for namespace in ("users", "stats", "summary"):
+        await FastAPICache.clear(namespace=namespace)
 
 # API Routes
 
@@ -180,23 +249,25 @@ async def health_check():
     """Health check endpoint"""
     print("🔍 /api/health endpoint called")
     try:
-        supabase_status = supabase_manager.is_connected()
+        supabase_status = get_supabase().is_connected()
         
         # Test if tables exist by trying a simple query
         tables_exist = True
         error_details = []
         
         if supabase_status:
+            def probe(table: str):
+                return get_supabase().client.table(table).select('id').limit(1).execute()
+            
             try:
-                # Test users table
-                result = supabase_manager.client.table('users').select('id').limit(1).execute()
+                # Probe the users and memory_nodes tables concurrently
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(asyncio.to_thread(probe, 'users'))
+                    tg.create_task(asyncio.to_thread(probe, 'memory_nodes'))
                 
-                # Test memory_nodes table  
-                result = supabase_manager.client.table('memory_nodes').select('id').limit(1).execute()
-                
-            except Exception as e:
+            except* Exception as eg:
                 tables_exist = False
-                error_details.append(str(e))
+                error_details.extend(str(e) for e in eg.exceptions)
         
         return {
             "status": "healthy" if supabase_status and tables_exist else "unhealthy",
@@ -215,21 +286,23 @@ async def health_check():
         }
 
 @app.get("/api/users", response_model=List[str])
-async def get_users():
+@cache(expire=120, namespace="users", key_builder=dashboard_cache_key)
+async def get_users(db=Depends(get_db)):
     """Get list of all users"""
     try:
-        users = await supabase_manager.get_all_users()
+        users = await db.get_all_users()
         return users
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/users/{user_id}/summary", response_model=UserSummary)
-async def get_user_summary(user_id: str):
+@cache(expire=30, namespace="summary", key_builder=dashboard_cache_key)
+async def get_user_summary(user_id: str, db=Depends(get_db)):
     """Get summary statistics for a user"""
     try:
-        print(f"Getting summary for user: {user_id}")
-        summary = await supabase_manager.get_user_summary(user_id)
-        print(f"Summary result: {summary}")
+        logger.debug("Getting summary for user: %s", user_id)
+        summary = await db.get_user_summary(user_id)
+        logger.debug("Summary result: %s", summary)
         
         return UserSummary(
             user_id=user_id,
@@ -240,28 +313,47 @@ async def get_user_summary(user_id: str):
             layers=summary.get('layers', {})
         )
     except Exception as e:
-        print(f"Error in get_user_summary: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_user_summary for %s", user_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/users/{user_id}/memory", response_model=List[ConcludedFact])
-async def get_user_memory(user_id: str, layer: Optional[str] = None):
+async def get_user_memory(request: Request, response: Response, user_id: str,
+                          layer: Optional[str] = None, db=Depends(get_db)):
     """Get consolidated memory graph for a user with concluded facts"""
+    # Parse layer parameter (e.g., "Layer1" -> 1)
+    layer_num = parse_layer(layer)
+    
     try:
-        # Parse layer parameter (e.g., "Layer1" -> 1)
-        layer_num = None
-        if layer and layer.startswith('Layer'):
-            try:
-                layer_num = int(layer.replace('Layer', ''))
-            except ValueError:
-                pass
-        
-        memory_facts = await supabase_manager.get_user_memory_graph(user_id, layer_num)
-        
+        # Nodes are append-only apart from reviews, so the row count plus the latest
+        # created/reviewed timestamps identify this version of the graph
+        if db is db_pool:
+            count, last_created, last_reviewed = await db_pool.get_user_memory_version(user_id, layer_num)
+        else:
+            memory_facts = await db.get_user_memory_graph(user_id, layer_num)
+            count = len(memory_facts)
+            last_created = max((fact['created_at'] for fact in memory_facts), default='')
+            last_reviewed = max((fact.get('reviewed_at') or '' for fact in memory_facts), default='')
+        etag_source = f"{layer_num}:{count}:{last_created}:{last_reviewed}"
+        etag = '"' + hashlib.blake2b(etag_source.encode(), digest_size=16).hexdigest() + '"'
+        
+        if etag_matches(etag, request.headers.get('if-none-match', '')):
+            return Response(status_code=304, headers={'ETag': etag})
+        
+        if db is db_pool:
+            # Large graphs are streamed straight from a DB cursor instead of buffered
+            if count > _STREAM_MIN_FACTS:
+                return StreamingResponse(
+                    stream_concluded_facts(user_id, layer_num),
+                    media_type="application/json",
+                    headers={'ETag': etag}
+                )
+            memory_facts = await db_pool.get_user_memory_graph(user_id, layer_num)
+        response.headers['ETag'] = etag
+        
+        # Rows come from our own schema, so skip per-field validation
         concluded_facts = []
         for fact in memory_facts:
-            concluded_facts.append(ConcludedFact(
+            concluded_facts.append(ConcludedFact.model_construct(
                 id=fact['id'],
                 user_id=user_id,
                 layer=fact['layer'],
@@ -279,42 +371,45 @@ async def get_user_memory(user_id: str, layer: Optional[str] = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/updates/pending")
-async def get_pending_updates(limit: int = 500, layer: Optional[str] = None):
+async def get_pending_updates(limit: int = 500, layer: Optional[str] = None, db=Depends(get_db)):
     """Get pending update proposals with concluded facts, optionally filtered by layer"""
+    parse_layer(layer)
+    
     try:
-        pending_updates = await supabase_manager.get_pending_updates(limit, layer)
+        pending_updates = await db.get_pending_updates(limit, layer)
         
-        # Enhance with additional metadata for ops review
-        enhanced_updates = []
+        # Enhance with additional metadata for ops review, counting buckets in the same pass.
+        # Both DB backends build fresh dicts per row, so they are annotated in place.
+        level_counts = {'high': 0, 'medium': 0, 'low': 0}
+        reprocessed_items = 0
         for update in pending_updates:
-            enhanced_update = update.copy()
-            
             # Add confidence categorization
             confidence = update.get('confidence', 0)
             if confidence >= 0.9:
-                enhanced_update['confidence_level'] = 'high'
+                level = 'high'
             elif confidence >= 0.7:
-                enhanced_update['confidence_level'] = 'medium'
+                level = 'medium'
             else:
-                enhanced_update['confidence_level'] = 'low'
+                level = 'low'
+            update['confidence_level'] = level
+            level_counts[level] += 1
             
             # Add evidence count
-            evidence = update.get('evidence', [])
-            enhanced_update['evidence_count'] = len(evidence)
-            
-            # Add extraction method info (will be available after schema update)
-            enhanced_update['is_reprocessed'] = False  # Default for now
+            update['evidence_count'] = len(update.get('evidence', []))
             
-            enhanced_updates.append(enhanced_update)
+            # Flag nodes produced by reprocessing a rejected update
+            update['is_reprocessed'] = update.get('extraction_method') == 'reprocess'
+            if update['is_reprocessed']:
+                reprocessed_items += 1
         
         return {
-            "total_pending": len(enhanced_updates),
-            "updates": enhanced_updates,
+            "total_pending": len(pending_updates),
+            "updates": pending_updates,
             "summary": {
-                "high_confidence": len([u for u in enhanced_updates if u['confidence_level'] == 'high']),
-                "medium_confidence": len([u for u in enhanced_updates if u['confidence_level'] == 'medium']),
-                "low_confidence": len([u for u in enhanced_updates if u['confidence_level'] == 'low']),
-                "reprocessed_items": len([u for u in enhanced_updates if u['is_reprocessed']])
+                "high_confidence": level_counts['high'],
+                "medium_confidence": level_counts['medium'],
+                "low_confidence": level_counts['low'],
+                "reprocessed_items": reprocessed_items
             }
         }
     except Exception as e:
@@ -324,8 +419,9 @@ async def get_pending_updates(limit: int = 500, layer: Optional[str] = None):
 async def approve_update(update_id: str, action: UpdateAction):
     """Approve an update proposal"""
     try:
-        success = await supabase_manager.approve_update(update_id, action.reviewed_by)
+        success = await get_supabase().approve_update(update_id, action.reviewed_by)
         if success:
+            await invalidate_dashboard_cache()
             return {"status": "approved", "update_id": update_id}
         else:
             raise HTTPException(status_code=400, detail="Failed to approve update")
@@ -336,8 +432,9 @@ async def approve_update(update_id: str, action: UpdateAction):
 async def reject_update(update_id: str, action: UpdateAction):
     """Reject an update proposal and trigger re-extraction"""
     try:
-        success = await supabase_manager.reject_update(update_id, action.reviewed_by)
+        success = await get_supabase().reject_update(update_id, action.reviewed_by)
         if success:
+            await invalidate_dashboard_cache()
             # TODO: Implement re-extraction logic here
             # This would involve getting the original context and re-processing
             return {"status": "rejected", "update_id": update_id, "re_extraction": "scheduled"}
@@ -346,13 +443,36 @@ async def reject_update(update_id: str, action: UpdateAction):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/updates/approve")
+async def approve_updates(action: BulkUpdateAction):
+    """Approve several update proposals at once"""
+    try:
+        updated = await get_supabase().approve_updates(action.update_ids, action.reviewed_by)
+        if updated:
+            await invalidate_dashboard_cache()
+        return {"status": "approved", "updated": updated, "requested": len(action.update_ids)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/updates/reject")
+async def reject_updates(action: BulkUpdateAction):
+    """Reject several update proposals at once and mark them for re-extraction"""
+    try:
+        updated = await get_supabase().reject_updates(action.update_ids, action.reviewed_by)
+        if updated:
+            await invalidate_dashboard_cache()
+        return {"status": "rejected", "updated": updated, "requested": len(action.update_ids)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/stats")
-async def get_system_stats():
+@cache(expire=60, namespace="stats", key_builder=dashboard_cache_key)
+async def get_system_stats(db=Depends(get_db)):
     """Get overall system statistics"""
     print("🔍 /api/stats endpoint called")
     try:
         print("📊 Attempting to get system stats from Supabase...")
-        stats = await supabase_manager.get_system_stats()
+        stats = await db.get_system_stats()
         print(f"✅ Stats retrieved successfully: {stats}")
         return stats
     except Exception as e:
@@ -363,55 +483,56 @@ async def get_system_stats():
 async def process_all_input_jsons(force_reprocess: bool = False):
     """Process all JSON files in input_jsons/ directory and extract memory facts"""
     try:
-        import json
-        import os
-        from pathlib import Path
-        
-        input_folder = Path("input_jsons")
-        if not input_folder.exists():
+        input_folder = "input_jsons"
+        if not os.path.isdir(input_folder):
             raise HTTPException(status_code=404, detail="input_jsons directory not found")
         
-        # Get all JSON files
-        json_files = list(input_folder.glob("*.json"))
+        # Get all JSON files (scandir exposes the entry type without a stat per file)
+        with os.scandir(input_folder) as entries:
+            json_files = [
+                entry.path for entry in entries
+                if entry.name.endswith('.json') and entry.is_file(follow_symlinks=False)
+            ]
         if not json_files:
             raise HTTPException(status_code=404, detail="No JSON files found in input_jsons directory")
         
-        results = {}
-        total_processed = 0
-        
-        for json_file in json_files:
+        async def process_file(json_file: str):
+            # Extract user ID from filename (remove .json extension)
+            user_id = os.path.basename(json_file)[:-len('.json')]
             try:
-                # Extract user ID from filename (remove .json extension)
-                user_id = json_file.stem
-                
-                # Read and process the JSON file
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                
-                # Process with extractor
-                extracted_data = await extractor.process_json(json_data, user_id, force_reprocess)
+                async with _PROCESS_SEMAPHORE:
+                    json_data = await load_json_file(json_file)
+                    
+                    # Process with extractor
+                    extracted_data = await run_extraction(json_data, user_id, force_reprocess)
                 
                 # Count extracted nodes (handle skipped files)
                 if extracted_data.get("skipped"):
-                    results[user_id] = {
+                    return user_id, {
                         "status": "skipped",
                         "message": "Already processed"
                     }
-                else:
-                    total_nodes = sum(len(nodes) for nodes in extracted_data.values())
-                    results[user_id] = {
-                        "status": "success",
-                        "total_nodes_extracted": total_nodes,
-                        "layers": {layer: len(nodes) for layer, nodes in extracted_data.items()}
-                    }
-                    total_processed += 1
+                
+                total_nodes = sum(len(nodes) for nodes in extracted_data.values())
+                return user_id, {
+                    "status": "success",
+                    "total_nodes_extracted": total_nodes,
+                    "layers": {layer: len(nodes) for layer, nodes in extracted_data.items()}
+                }
                 
             except Exception as e:
-                results[user_id] = {
+                return user_id, {
                     "status": "error",
                     "error": str(e)
                 }
         
+        # Process files concurrently; each task reports its own errors
+        results = dict(await asyncio.gather(*[process_file(json_file) for json_file in json_files]))
+        total_processed = sum(1 for result in results.values() if result["status"] == "success")
+        
+        if total_processed:
+            await invalidate_dashboard_cache()
+        
         return {
             "message": f"Processing completed for {len(json_files)} files",
             "total_files_processed": total_processed,
@@ -425,28 +546,21 @@ async def process_all_input_jsons(force_reprocess: bool = False):
 async def process_single_json(user_id: str, force_reprocess: bool = False):
     """Process a specific user's JSON file"""
     try:
-        import json
-        from pathlib import Path
-        
         json_file = Path(f"input_jsons/{user_id}.json")
         if not json_file.exists():
             raise HTTPException(status_code=404, detail=f"JSON file for user {user_id} not found")
         
         # Read and process the JSON file
-        with open(json_file, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
+        json_data = await load_json_file(json_file)
         
         # Process with extractor (now passing force_reprocess parameter)
         print(f"🔍 Starting processing for user: {user_id}")
         try:
-            extracted_data = await extractor.process_json(json_data, user_id, force_reprocess)
+            extracted_data = await run_extraction(json_data, user_id, force_reprocess)
             print(f"✅ Successfully processed {user_id}")
-        except Exception as extract_error:
-            print(f"❌ Error during extraction for {user_id}: {str(extract_error)}")
-            print(f"❌ Extract error type: {type(extract_error).__name__}")
-            import traceback
-            print(f"❌ Full traceback: {traceback.format_exc()}")
-            raise extract_error
+        except Exception:
+            logger.exception("Error during extraction for %s", user_id)
+            raise
         
         # Handle skipped files
         if extracted_data.get("skipped"):
@@ -456,6 +570,8 @@ async def process_single_json(user_id: str, force_reprocess: bool = False):
                 "message": "Already processed. Use force_reprocess=True to reprocess."
             }
         
+        await invalidate_dashboard_cache()
+        
         # Count extracted nodes (now contains only newly stored facts)
         total_nodes = sum(len(nodes) for nodes in extracted_data.values())
         
@@ -472,32 +588,30 @@ async def process_single_json(user_id: str, force_reprocess: bool = False):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/reprocess/{node_id}")
-async def reprocess_rejected_node(node_id: str):
+async def reprocess_rejected_node(node_id: str, db=Depends(get_db)):
     """Reprocess a specific rejected memory node by looking in alternative contexts"""
     try:
         # Get the rejected node details
-        if not supabase_manager.is_connected():
+        if not db.is_connected():
             raise HTTPException(status_code=503, detail="Database not available")
         
-        # Get node details
-        result = supabase_manager.client.table('memory_nodes').select('''
-            *,
-            users!inner(phone_number)
-        ''').eq('id', node_id).eq('status', 'rejected').eq('needs_reprocess', True).execute()
+        # Get node details (joined with the user's phone number server-side)
+        node = await db.get_rejected_node(node_id)
         
-        if not result.data:
+        if not node:
             raise HTTPException(status_code=404, detail="Rejected node not found or not marked for reprocessing")
         
-        node = result.data[0]
-        user_id = node['users']['phone_number']
+        user_id = node['phone_number']
         fact_type = node['fact_type']
         layer = f"layer_{node['layer']}"
         
-        # Extract message IDs from the original evidence to exclude them
-        excluded_message_ids = []
-        for evidence_item in node.get('evidence', []):
-            if 'message_id' in evidence_item:
-                excluded_message_ids.append(evidence_item['message_id'])
+        # Extract message IDs from the original evidence to exclude them (hashed for
+        # constant-time membership checks while filtering the user's messages)
+        excluded_message_ids = {
+            evidence_item['message_id']
+            for evidence_item in node.get('evidence', [])
+            if 'message_id' in evidence_item
+        }
         
         # Reprocess using the extractor
         extracted_data = await extractor.reprocess_rejected_fact(
@@ -508,6 +622,8 @@ async def reprocess_rejected_node(node_id: str):
             original_node_id=node_id
         )
         
+        await invalidate_dashboard_cache()
+        
         # Count reprocessed nodes
         total_nodes = sum(len(nodes) for nodes in extracted_data.values())
         
@@ -525,10 +641,10 @@ async def reprocess_rejected_node(node_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/reprocess/candidates")
-async def get_reprocessing_candidates():
+async def get_reprocessing_candidates(db=Depends(get_db)):
     """Get all rejected nodes that need reprocessing"""
     try:
-        candidates = await supabase_manager.get_rejected_items_for_reprocessing()
+        candidates = await db.get_rejected_items_for_reprocessing()
         return {
             "total_candidates": len(candidates),
             "candidates": candidates
@@ -0,0 +1,17 @@
+-- Consolidate RLS policies for existing databases
+-- Run this SQL in your Supabase SQL Editor
+
+-- The two permissive policies per table were both evaluated for every row, and
+-- auth.role()/auth.jwt() were re-evaluated per row. Replace them with a single
+-- policy whose auth call is wrapped in a SELECT so it is evaluated once (InitPlan).
+
+DROP POLICY IF EXISTS "Allow all operations for authenticated users" ON users;
+DROP POLICY IF EXISTS "Allow service role full access" ON users;
+DROP POLICY IF EXISTS "Allow all operations for authenticated users" ON memory_nodes;
+DROP POLICY IF EXISTS "Allow service role full access" ON memory_nodes;
+
+CREATE POLICY "Allow authenticated and service role access" ON users 
+    FOR ALL USING ((SELECT auth.role()) IN ('authenticated', 'service_role'));
+
+CREATE POLICY "Allow authenticated and service role access" ON memory_nodes 
+    FOR ALL USING ((SELECT auth.role()) IN ('authenticated', 'service_role'));
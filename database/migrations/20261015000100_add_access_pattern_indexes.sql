@@ -0,0 +1,18 @@
+-- Composite and partial indexes for existing databases
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so run
+-- these statements one at a time in the Supabase SQL Editor
+
+-- get_user_memory_graph: user_id filter, newest first
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_nodes_user_created
+    ON memory_nodes(user_id, created_at DESC);
+
+-- get_pending_updates without and with a layer filter
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_nodes_pending_created
+    ON memory_nodes(created_at DESC) WHERE status = 'pending';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_nodes_pending_layer_created
+    ON memory_nodes(layer, created_at DESC) WHERE status = 'pending';
+
+-- get_rejected_items_for_reprocessing
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_nodes_reprocess
+    ON memory_nodes(created_at DESC) WHERE status = 'rejected' AND needs_reprocess = TRUE;
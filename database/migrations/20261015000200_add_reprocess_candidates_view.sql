@@ -0,0 +1,41 @@
+-- Materialized reprocessing candidates for existing databases
+-- Run this SQL in your Supabase SQL Editor
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_reprocess_candidates AS
+    SELECT id, user_id, layer, fact_type, content, concluded_fact, confidence, evidence,
+           created_at, reviewed_at, parent_update_id
+    FROM memory_nodes
+    WHERE status = 'rejected' AND needs_reprocess = TRUE;
+
+-- Unique index required for REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_reprocess_candidates_id ON mv_reprocess_candidates(id);
+CREATE INDEX IF NOT EXISTS idx_mv_reprocess_candidates_created_at ON mv_reprocess_candidates(created_at DESC);
+
+-- Materialized views bypass RLS, so keep the copied rows away from API callers;
+-- only the asyncpg pool (table owner) reads the view
+REVOKE ALL ON mv_reprocess_candidates FROM anon, authenticated;
+
+CREATE OR REPLACE FUNCTION refresh_reprocess_candidates()
+RETURNS VOID AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_reprocess_candidates;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+REVOKE EXECUTE ON FUNCTION refresh_reprocess_candidates() FROM PUBLIC, anon, authenticated;
+
+-- Signal the API's LISTEN consumer when a node is reviewed, reprocessed or removed;
+-- the refresh itself runs debounced outside the writing transaction
+CREATE OR REPLACE FUNCTION notify_reprocess_candidates()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('reprocess_candidates', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS refresh_reprocess_candidates_on_change ON memory_nodes;
+DROP FUNCTION IF EXISTS refresh_reprocess_candidates_trigger();
+CREATE TRIGGER refresh_reprocess_candidates_on_change
+    AFTER UPDATE OF status, needs_reprocess OR DELETE ON memory_nodes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reprocess_candidates();
@@ -0,0 +1,71 @@
+-- Server-side RPC functions for existing databases
+-- Run this SQL in your Supabase SQL Editor
+
+-- Rejected node lookup for /api/reprocess/{node_id}: one round trip, joined server-side
+CREATE OR REPLACE FUNCTION get_rejected_node(p_node_id UUID)
+RETURNS TABLE (
+    id UUID,
+    user_id TEXT,
+    phone_number TEXT,
+    layer INTEGER,
+    fact_type VARCHAR,
+    evidence JSONB
+) AS $$
+    SELECT m.id, m.user_id::text, COALESCE(u.phone_number, m.user_id::text), m.layer, m.fact_type, m.evidence
+    FROM memory_nodes m
+    LEFT JOIN users u ON u.id::text = m.user_id::text
+    WHERE m.id = p_node_id AND m.status = 'rejected' AND m.needs_reprocess = TRUE;
+$$ LANGUAGE sql STABLE;
+
+-- Per-user memory summary for /api/users/{id}/summary, aggregated in a single query
+CREATE OR REPLACE FUNCTION fn_user_summary(p_user_id TEXT)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_nodes', COUNT(*),
+        'approved_nodes', COUNT(*) FILTER (WHERE status = 'approved'),
+        'pending_nodes', COUNT(*) FILTER (WHERE status = 'pending'),
+        'rejected_nodes', COUNT(*) FILTER (WHERE status = 'rejected'),
+        'layers', COALESCE((
+            SELECT jsonb_object_agg('Layer' || l.layer, l.cnt)
+            FROM (
+                SELECT layer, COUNT(*) AS cnt FROM memory_nodes
+                WHERE user_id::text = p_user_id GROUP BY layer
+            ) l
+        ), '{}'::jsonb)
+    )
+    FROM memory_nodes
+    WHERE user_id::text = p_user_id;
+$$ LANGUAGE sql STABLE;
+
+-- Distinct users with memory nodes for /api/users (served from idx_memory_nodes_user_id)
+CREATE OR REPLACE FUNCTION get_distinct_memory_users()
+RETURNS SETOF TEXT AS $$
+    SELECT DISTINCT user_id::text FROM memory_nodes;
+$$ LANGUAGE sql STABLE;
+
+-- A user's evidence items, minus those citing excluded message IDs (used when reprocessing)
+CREATE OR REPLACE FUNCTION get_user_evidence_excluding(p_user TEXT, p_exclude TEXT[])
+RETURNS SETOF JSONB AS $$
+    SELECT ev
+    FROM memory_nodes m, jsonb_array_elements(m.evidence) ev
+    WHERE m.user_id::text = p_user
+      AND COALESCE(ev->>'message_id', '') <> ''
+      AND NOT (ev->>'message_id' = ANY(p_exclude));
+$$ LANGUAGE sql STABLE;
+
+-- Status/layer counts for one user, grouped server-side instead of shipping every row
+CREATE OR REPLACE FUNCTION get_user_memory_stats(p_user TEXT)
+RETURNS TABLE (status TEXT, layer INT, cnt BIGINT) AS $$
+    SELECT m.status::text, m.layer, COUNT(*)
+    FROM memory_nodes m
+    WHERE m.user_id::text = p_user
+    GROUP BY m.status, m.layer;
+$$ LANGUAGE sql STABLE;
+
+-- Status/layer counts across all users for /api/stats
+CREATE OR REPLACE FUNCTION get_system_memory_stats()
+RETURNS TABLE (status TEXT, layer INT, cnt BIGINT) AS $$
+    SELECT m.status::text, m.layer, COUNT(*)
+    FROM memory_nodes m
+    GROUP BY m.status, m.layer;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,7 @@
+-- GIN index on evidence for existing databases
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so run
+-- this statement on its own in the Supabase SQL Editor
+
+-- get_user_evidence_excluding and evidence containment lookups
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memory_nodes_evidence
+    ON memory_nodes USING gin (evidence jsonb_path_ops);
@@ -0,0 +1,285 @@
+"""
+Direct Postgres connection pool for the Memory System
+Serves the read-heavy API endpoints over reused asyncpg connections
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import logging
+from typing import List, Dict, Optional, AsyncIterator
+import asyncpg
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabasePool:
+    # NOTIFY channel raised by the memory_nodes trigger when candidates may have changed
+    CANDIDATES_CHANNEL = 'reprocess_candidates'
+    # Seconds to wait after a notification so a burst of review writes triggers one refresh
+    CANDIDATES_REFRESH_DELAY = 2.0
+
+    _MEMORY_GRAPH_SELECT = """
+        SELECT id, layer, fact_type, content, concluded_fact, confidence, status,
+               evidence, created_at, reviewed_at, reviewed_by
+        FROM memory_nodes
+    """
+
+    def __init__(self):
+        # Supabase session pooler connection string (port 5432)
+        self.dsn = os.getenv('SUPABASE_DB_URL')
+        self.pool: Optional[asyncpg.Pool] = None
+        # Dedicated session connection holding the LISTEN (pooled connections are recycled)
+        self._listener: Optional[asyncpg.Connection] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_requested = False
+
+    @staticmethod
+    async def _init_connection(conn: asyncpg.Connection):
+        """Decode JSONB columns (evidence) into Python objects"""
+        await conn.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+    async def connect(self):
+        """Open the pool; leaves it disabled if no DSN is configured"""
+        if not self.dsn:
+            logger.info("SUPABASE_DB_URL not set, Postgres pool disabled")
+            return
+
+        try:
+            self.pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=10,
+                max_size=50,
+                max_inactive_connection_lifetime=300,
+                command_timeout=60,
+                # Avoid prepared statement name clashes behind the Supabase pooler
+                statement_cache_size=0,
+                init=self._init_connection
+            )
+            logger.info("Postgres connection pool initialized successfully")
+        except Exception as e:
+            logger.error("Failed to initialize Postgres connection pool: %s", e)
+            self.pool = None
+            return
+
+        try:
+            self._listener = await asyncpg.connect(self.dsn, statement_cache_size=0)
+            await self._listener.add_listener(self.CANDIDATES_CHANNEL, self._on_candidates_changed)
+        except Exception as e:
+            logger.warning("Could not listen for reprocessing candidate changes: %s", e)
+            self._listener = None
+        # Catch up on changes made while no listener was connected
+        self.schedule_candidates_refresh()
+
+    async def close(self):
+        """Close all pooled connections"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def is_connected(self) -> bool:
+        """Check if the connection pool is open"""
+        return self.pool is not None
+
+    async def get_all_users(self) -> List[str]:
+        """Get all unique user phone numbers"""
+        rows = await self.pool.fetch("SELECT DISTINCT user_id FROM memory_nodes")
+        return [str(row['user_id']) for row in rows]
+
+    async def get_user_summary(self, user_phone: str) -> Dict:
+        """Get memory statistics for a specific user"""
+        # Status and layer buckets are aggregated server-side in one query
+        return await self.pool.fetchval("SELECT fn_user_summary($1)", user_phone)
+
+    @staticmethod
+    def _memory_graph_filter(user_phone: str, layer: Optional[int]) -> tuple:
+        """WHERE clause and arguments shared by the memory graph queries"""
+        where = "WHERE user_id = $1"
+        args = [user_phone]
+        if layer:
+            where += " AND layer = $2"
+            args.append(layer)
+        return where, args
+
+    @staticmethod
+    def _format_memory_row(row: asyncpg.Record) -> Dict:
+        """Format a memory node row for the frontend"""
+        return {
+            'id': str(row['id']),
+            'layer': f"Layer{row['layer']}",
+            'fact_type': row['fact_type'],
+            'content': row['content'],
+            'conclusion': row['concluded_fact'],
+            'confidence': float(row['confidence']),
+            'status': row['status'],
+            'evidence': row['evidence'] or [],
+            'created_at': row['created_at'].isoformat(),
+            'reviewed_at': row['reviewed_at'].isoformat() if row['reviewed_at'] else None,
+            'reviewed_by': row['reviewed_by']
+        }
+
+    async def get_user_memory_graph(self, user_phone: str, layer: Optional[int] = None) -> List[Dict]:
+        """Get memory facts for a user, optionally filtered by layer"""
+        where, args = self._memory_graph_filter(user_phone, layer)
+        rows = await self.pool.fetch(f"{self._MEMORY_GRAPH_SELECT} {where} ORDER BY created_at DESC", *args)
+        return [self._format_memory_row(row) for row in rows]
+
+    async def iter_user_memory_graph(self, user_phone: str, layer: Optional[int] = None,
+                                     prefetch: int = 256) -> AsyncIterator[Dict]:
+        """Stream memory facts for a user through a server-side cursor"""
+        where, args = self._memory_graph_filter(user_phone, layer)
+        query = f"{self._MEMORY_GRAPH_SELECT} {where} ORDER BY created_at DESC"
+        async with self.pool.acquire() as conn:
+            # Cursors only live inside a transaction
+            async with conn.transaction():
+                async for row in conn.cursor(query, *args, prefetch=prefetch):
+                    yield self._format_memory_row(row)
+
+    async def get_user_memory_version(self, user_phone: str, layer: Optional[int] = None) -> tuple:
+        """Row count and latest created/reviewed timestamps of a user's memory graph"""
+        where, args = self._memory_graph_filter(user_phone, layer)
+        row = await self.pool.fetchrow(
+            f"SELECT COUNT(*) AS cnt, MAX(created_at) AS last_created, MAX(reviewed_at) AS last_reviewed "
+            f"FROM memory_nodes {where}",
+            *args
+        )
+        return (
+            row['cnt'],
+            row['last_created'].isoformat() if row['last_created'] else '',
+            row['last_reviewed'].isoformat() if row['last_reviewed'] else ''
+        )
+
+    async def get_pending_updates(self, limit: int = 50, layer: Optional[str] = None) -> List[Dict]:
+        """Get pending memory updates for ops review, optionally filtered by layer"""
+        query = """
+            SELECT id, user_id, layer, fact_type, concluded_fact, confidence, evidence,
+                   extraction_method, created_at
+            FROM memory_nodes
+            WHERE status = 'pending'
+        """
+        args = []
+        # Layer comes as "Layer1", "Layer2", etc.
+        if layer:
+            args.append(int(layer.replace('Layer', '')))
+            query += f" AND layer = ${len(args)}"
+        args.append(limit)
+        query += f" ORDER BY created_at DESC LIMIT ${len(args)}"
+
+        rows = await self.pool.fetch(query, *args)
+
+        # Format for ops review interface
+        return [{
+            'id': str(row['id']),
+            'user_id': str(row['user_id']),
+            'layer': f"Layer{row['layer']}",
+            'fact_type': row['fact_type'],
+            'conclusion': row['concluded_fact'],
+            'confidence': float(row['confidence']),
+            'evidence': row['evidence'] or [],
+            'extraction_method': row['extraction_method'],
+            'created_at': row['created_at'].isoformat(),
+            'status': 'pending'
+        } for row in rows]
+
+    async def get_system_stats(self) -> Dict:
+        """Get overall system statistics"""
+        async with self.pool.acquire() as conn:
+            total_users = await conn.fetchval("SELECT COUNT(*) FROM users")
+            rows = await conn.fetch(
+                "SELECT status, layer, COUNT(*) AS cnt FROM memory_nodes GROUP BY status, layer"
+            )
+
+        counts = {'approved': 0, 'pending': 0, 'rejected': 0}
+        layer_distribution = {}
+        total_facts = 0
+        for row in rows:
+            total_facts += row['cnt']
+            if row['status'] in counts:
+                counts[row['status']] += row['cnt']
+            layer_key = f"Layer{row['layer']}"
+            layer_distribution[layer_key] = layer_distribution.get(layer_key, 0) + row['cnt']
+
+        # Calculate acceptance rate
+        total_reviewed = counts['approved'] + counts['rejected']
+        acceptance_rate = (counts['approved'] / total_reviewed * 100) if total_reviewed > 0 else 0
+
+        return {
+            'total_users': total_users,
+            'total_facts': total_facts,
+            'approved_facts': counts['approved'],
+            'pending_facts': counts['pending'],
+            'rejected_facts': counts['rejected'],
+            'acceptance_rate': round(acceptance_rate, 1),
+            'layer_distribution': layer_distribution
+        }
+
+    async def get_rejected_node(self, node_id: str) -> Optional[Dict]:
+        """Get a rejected node marked for reprocessing, with its user's phone number"""
+        # Match the REST backend: an id that is not a UUID simply finds no node
+        try:
+            node_uuid = uuid.UUID(node_id)
+        except ValueError:
+            return None
+        row = await self.pool.fetchrow("SELECT * FROM get_rejected_node($1)", node_uuid)
+        if row is None:
+            return None
+        node = dict(row)
+        node['id'] = str(node['id'])
+        node['evidence'] = node['evidence'] or []
+        return node
+
+    async def get_rejected_items_for_reprocessing(self, limit: int = 50) -> List[Dict]:
+        """Get rejected memory nodes that need reprocessing (from the precomputed view)"""
+        rows = await self.pool.fetch(
+            "SELECT * FROM mv_reprocess_candidates ORDER BY created_at DESC LIMIT $1",
+            limit
+        )
+
+        # Format for reprocessing
+        return [{
+            'id': str(row['id']),
+            'user_id': str(row['user_id']),
+            'layer': row['layer'],
+            'fact_type': row['fact_type'],
+            'content': row['content'],
+            'concluded_fact': row['concluded_fact'],
+            'confidence': float(row['confidence']),
+            'evidence': row['evidence'] or [],
+            'created_at': row['created_at'].isoformat(),
+            'rejected_at': row['reviewed_at'].isoformat() if row['reviewed_at'] else None,
+            'parent_update_id': str(row['parent_update_id']) if row['parent_update_id'] else None
+        } for row in rows]
+
+    def _on_candidates_changed(self, connection, pid, channel, payload):
+        self.schedule_candidates_refresh()
+
+    def schedule_candidates_refresh(self):
+        """Refresh the reprocessing candidates view shortly, coalescing bursts of notifications"""
+        if not self.is_connected():
+            return
+        self._refresh_requested = True
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_candidates())
+
+    async def _refresh_candidates(self):
+        # Loop so a notification that arrives mid-refresh still gets a refresh of its own
+        while self._refresh_requested:
+            await asyncio.sleep(self.CANDIDATES_REFRESH_DELAY)
+            self._refresh_requested = False
+            try:
+                await self.pool.execute("SELECT refresh_reprocess_candidates()")
+            except Exception:
+                logger.exception("Failed to refresh reprocessing candidates")
+
+# Global instance (opened/closed by the FastAPI lifespan handler)
+db_pool = AsyncDatabasePool()
@@ -4,11 +4,17 @@ Replaces PostgreSQL with hosted Supabase database
 """
 
 import os
+import atexit
+import asyncio
+import httpx
 from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
+from postgrest.utils import SyncClient
 from typing import List, Dict, Any, Optional
+from functools import lru_cache
 import logging
 from datetime import datetime
-import json
+import orjson
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,10 +22,29 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Sized for concurrent to_thread/gather bursts so requests reuse warm connections
+_HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=25, keepalive_expiry=60.0)
+
+# Fallback log entries buffered before forcing a flush to disk
+FALLBACK_FLUSH_EVERY = 100
+
+class _OrjsonSyncClient(SyncClient):
+    """PostgREST session that encodes JSON request bodies (bulk inserts, evidence) with orjson"""
+    def build_request(self, method, url, *, content=None, json=None, headers=None, **kwargs):
+        if json is not None and content is None:
+            content = orjson.dumps(json)
+            headers = httpx.Headers(headers)
+            headers['Content-Type'] = 'application/json'
+            json = None
+        return super().build_request(method, url, content=content, json=json, headers=headers, **kwargs)
+
 class SupabaseManager:
     def __init__(self):
         self.supabase_url = os.getenv('SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_ANON_KEY')
+        # Fallback log handle, opened on first use and flushed every few entries
+        self._fallback_fh = None
+        self._fallback_unflushed = 0
         
         if not self.supabase_url or not self.supabase_key:
             logger.error("Supabase credentials not found in environment variables")
@@ -28,17 +53,39 @@ class SupabaseManager:
             return
             
         try:
-            self.client: Client = create_client(self.supabase_url, self.supabase_key)
+            options = ClientOptions(postgrest_client_timeout=30, schema='public')
+            self.client: Client = create_client(self.supabase_url, self.supabase_key, options=options)
+            self._tune_postgrest_session()
             logger.info("Supabase client initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Supabase client: {e}")
             self.client = None
 
+    def _tune_postgrest_session(self):
+        """Swap the PostgREST HTTP session for one with a larger keep-alive pool and orjson bodies"""
+        # supabase-py 2.8 has no option for the httpx client, so rebuild it with the same settings.
+        # The session is only recreated on auth state changes, which this backend never triggers.
+        postgrest = self.client.postgrest
+        session = postgrest.session
+        postgrest.session = _OrjsonSyncClient(
+            base_url=session.base_url,
+            headers=session.headers,
+            timeout=session.timeout,
+            follow_redirects=True,
+            http2=True,
+            limits=_HTTP_LIMITS
+        )
+        session.close()
+
     def is_connected(self) -> bool:
         """Check if Supabase client is properly initialized"""
         return self.client is not None
 
-    async def create_user(self, phone_number: str, name: str = None) -> Optional[Dict]:
+    async def _run(self, fn):
+        """Run a blocking supabase-py call in a worker thread so it doesn't stall the event loop"""
+        return await asyncio.to_thread(fn)
+
+    def create_user(self, phone_number: str, name: str = None) -> Optional[Dict]:
         """Create or get existing user - bypass RLS by disabling user table dependency"""
         if not self.is_connected():
             logger.error("Supabase client not connected")
@@ -67,15 +114,9 @@ class SupabaseManager:
             return None
             
         try:
-            # Get user info (bypasses RLS)
-            user = await self.create_user(user_phone)
-            if not user:
-                logger.error(f"Failed to create/get user: {user_phone}")
-                return None
-            
             # Store memory node with existing schema (use user_id field)
             node_data = {
-                'user_id': user['id'],  # This will be the phone number
+                'user_id': user_phone,  # Phone number is used as the user ID directly
                 'layer': layer,
                 'fact_type': fact_type,
                 'content': content,
@@ -87,7 +128,7 @@ class SupabaseManager:
                 'parent_update_id': parent_update_id
             }
             
-            result = self.client.table('memory_nodes').insert(node_data).execute()
+            result = await self._run(self.client.table('memory_nodes').insert(node_data).execute)
             
             if result.data:
                 logger.info(f"Stored memory node for user {user_phone}: {concluded_fact}")
@@ -100,21 +141,68 @@ class SupabaseManager:
             logger.error(f"Error storing memory node: {e}")
             return None
 
+    async def store_memory_nodes_bulk(self, nodes: List[Dict], batch_size: int = 500) -> List[Optional[str]]:
+        """Store many memory nodes with one insert per batch and return their IDs in input order"""
+        if not self.is_connected():
+            logger.error("Supabase client not connected")
+            return [None] * len(nodes)
+        
+        node_ids = []
+        # Batches keep each request under PostgREST payload limits
+        for start in range(0, len(nodes), batch_size):
+            batch = [{
+                'status': 'pending',
+                'extraction_method': 'initial',
+                'parent_update_id': None,
+                **node
+            } for node in nodes[start:start + batch_size]]
+            
+            try:
+                # The returned rows are needed to map new IDs back to the input order
+                result = await self._run(
+                    self.client.table('memory_nodes').insert(batch, returning='representation').execute
+                )
+                
+                if result.data and len(result.data) == len(batch):
+                    node_ids.extend(row['id'] for row in result.data)
+                    logger.info(f"Stored {len(batch)} memory nodes in bulk")
+                else:
+                    logger.error(f"Bulk insert returned {len(result.data or [])} of {len(batch)} memory nodes")
+                    node_ids.extend([None] * len(batch))
+                    
+            except Exception as e:
+                logger.error(f"Error storing memory nodes in bulk: {e}")
+                node_ids.extend([None] * len(batch))
+        
+        return node_ids
+
     async def get_all_users(self) -> List[str]:
         """Get all unique user phone numbers"""
         if not self.is_connected():
             return []
             
         try:
-            result = self.client.table('memory_nodes').select('user_id').execute()
-            # Get unique phone numbers from user_id field
-            phones = list(set([node['user_id'] for node in result.data]))
+            # Unique phone numbers from the user_id field, deduplicated in Postgres
+            result = await self._run(self.client.rpc('get_distinct_memory_users').execute)
+            phones = result.data
             return phones
             
         except Exception as e:
             logger.error(f"Error getting users: {e}")
             return []
 
+    @staticmethod
+    def _tally_memory_stats(rows: List[Dict]) -> tuple:
+        """Fold (status, layer, cnt) rows into status counts and a layer distribution"""
+        counts = {'approved': 0, 'pending': 0, 'rejected': 0}
+        layers = {}
+        for row in rows:
+            if row['status'] in counts:
+                counts[row['status']] += row['cnt']
+            layer_key = f"Layer{row['layer']}"
+            layers[layer_key] = layers.get(layer_key, 0) + row['cnt']
+        return counts, layers
+
     async def get_user_summary(self, user_phone: str) -> Dict:
         """Get memory statistics for a specific user"""
         if not self.is_connected():
@@ -123,23 +211,16 @@ class SupabaseManager:
             
         try:
             logger.info(f"Getting user summary for: {user_phone}")
-            # Get all memory nodes for this user (using user_id with phone value)
-            result = self.client.table('memory_nodes').select('status, layer').eq('user_id', user_phone).execute()
+            # Counts are grouped by status and layer in Postgres
+            result = await self._run(self.client.rpc('get_user_memory_stats', {'p_user': user_phone}).execute)
+            counts, layers = self._tally_memory_stats(result.data)
             
-            logger.info(f"Found {len(result.data)} memory nodes for {user_phone}")
+            total_nodes = sum(layers.values())
+            logger.info(f"Found {total_nodes} memory nodes for {user_phone}")
             
-            total_nodes = len(result.data)
-            approved_nodes = len([n for n in result.data if n['status'] == 'approved'])
-            pending_nodes = len([n for n in result.data if n['status'] == 'pending'])
-            rejected_nodes = len([n for n in result.data if n['status'] == 'rejected'])
-            
-            # Layer distribution
-            layers = {}
-            for node in result.data:
-                layer_key = f"Layer{node['layer']}"
-                if layer_key not in layers:
-                    layers[layer_key] = 0
-                layers[layer_key] += 1
+            approved_nodes = counts['approved']
+            pending_nodes = counts['pending']
+            rejected_nodes = counts['rejected']
             
             summary = {
                 'total_nodes': total_nodes,
@@ -149,17 +230,11 @@ class SupabaseManager:
                 'layers': layers
             }
             
-            logger.info(f"Summary for {user_phone}: {summary}")
+            logger.info("Summary for %s: %s", user_phone, summary)
             return summary
             
-        except Exception as e:
-            logger.error(f"Error getting user summary for {user_phone}: {e}")
-            import traceback
-            traceback.print_exc()
-            return {}
-            
-        except Exception as e:
-            logger.error(f"Error getting user summary: {e}")
+        except Exception:
+            logger.exception("Error getting user summary for %s", user_phone)
             return {}
 
     async def get_user_memory_graph(self, user_phone: str, layer: Optional[int] = None) -> List[Dict]:
@@ -169,28 +244,21 @@ class SupabaseManager:
             
         try:
             # Build query using user_id (which stores the phone number)
-            query = self.client.table('memory_nodes').select('*').eq('user_id', user_phone)
+            query = self.client.table('memory_nodes').select(
+                'id, layer, fact_type, conclusion:concluded_fact, confidence, status, evidence, '
+                'created_at, reviewed_at, reviewed_by'
+            ).eq('user_id', user_phone)
             
             if layer:
                 query = query.eq('layer', layer)
                 
-            result = query.order('created_at', desc=True).execute()
-            
-            # Format for frontend
-            memory_facts = []
-            for node in result.data:
-                memory_facts.append({
-                    'id': node['id'],
-                    'layer': f"Layer{node['layer']}",
-                    'fact_type': node['fact_type'],
-                    'conclusion': node['concluded_fact'],
-                    'confidence': node['confidence'],
-                    'status': node['status'],
-                    'evidence': node.get('evidence', []),
-                    'created_at': node['created_at'],
-                    'reviewed_at': node.get('reviewed_at'),
-                    'reviewed_by': node.get('reviewed_by')
-                })
+            result = await self._run(query.order('created_at', desc=True).execute)
+            
+            # Rows already come back in the frontend shape (conclusion is aliased
+            # server-side); only the layer label needs formatting
+            memory_facts = result.data
+            for node in memory_facts:
+                node['layer'] = f"Layer{node['layer']}"
             
             return memory_facts
             
@@ -205,29 +273,23 @@ class SupabaseManager:
             
         try:
             # Build query with optional layer filter
-            query = self.client.table('memory_nodes').select('*').eq('status', 'pending')
+            query = self.client.table('memory_nodes').select(
+                'id, user_id, layer, fact_type, conclusion:concluded_fact, confidence, evidence, '
+                'extraction_method, created_at'
+            ).eq('status', 'pending')
             
             # Add layer filter if specified (layer comes as "Layer1", "Layer2", etc.)
             if layer:
                 layer_num = int(layer.replace('Layer', ''))
                 query = query.eq('layer', layer_num)
             
-            result = query.order('created_at', desc=True).limit(limit).execute()
-            
-            # Format for ops review interface
-            pending_updates = []
-            for node in result.data:
-                pending_updates.append({
-                    'id': node['id'],
-                    'user_id': node['user_id'],  # Use user_id field
-                    'layer': f"Layer{node['layer']}",
-                    'fact_type': node['fact_type'],
-                    'conclusion': node['concluded_fact'],
-                    'confidence': node['confidence'],
-                    'evidence': node.get('evidence', []),
-                    'created_at': node['created_at'],
-                    'status': 'pending'
-                })
+            result = await self._run(query.order('created_at', desc=True).limit(limit).execute)
+            
+            # Format for ops review interface (conclusion is aliased server-side)
+            pending_updates = result.data
+            for node in pending_updates:
+                node['layer'] = f"Layer{node['layer']}"
+                node['status'] = 'pending'
             
             return pending_updates
             
@@ -241,11 +303,11 @@ class SupabaseManager:
             return False
             
         try:
-            result = self.client.table('memory_nodes').update({
+            result = await self._run(self.client.table('memory_nodes').update({
                 'status': 'approved',
                 'reviewed_by': reviewed_by,
                 'reviewed_at': datetime.utcnow().isoformat()
-            }).eq('id', update_id).execute()
+            }).eq('id', update_id).execute)
             
             success = len(result.data) > 0
             if success:
@@ -263,12 +325,12 @@ class SupabaseManager:
             return False
             
         try:
-            result = self.client.table('memory_nodes').update({
+            result = await self._run(self.client.table('memory_nodes').update({
                 'status': 'rejected',
                 'needs_reprocess': True,  # Flag for reprocessing
                 'reviewed_by': reviewed_by,
                 'reviewed_at': datetime.utcnow().isoformat()
-            }).eq('id', update_id).execute()
+            }).eq('id', update_id).execute)
             
             success = len(result.data) > 0
             if success:
@@ -280,37 +342,72 @@ class SupabaseManager:
             logger.error(f"Error rejecting update: {e}")
             return False
 
+    async def approve_updates(self, update_ids: List[str], reviewed_by: str) -> int:
+        """Approve several pending memory updates in one request and return how many changed"""
+        if not self.is_connected() or not update_ids:
+            return 0
+            
+        try:
+            result = await self._run(self.client.table('memory_nodes').update({
+                'status': 'approved',
+                'reviewed_by': reviewed_by,
+                'reviewed_at': datetime.utcnow().isoformat()
+            }).in_('id', update_ids).execute)
+            
+            updated = len(result.data)
+            logger.info(f"Approved {updated} of {len(update_ids)} updates by {reviewed_by}")
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error approving updates: {e}")
+            return 0
+
+    async def reject_updates(self, update_ids: List[str], reviewed_by: str) -> int:
+        """Reject several pending memory updates in one request and mark them for reprocessing"""
+        if not self.is_connected() or not update_ids:
+            return 0
+            
+        try:
+            result = await self._run(self.client.table('memory_nodes').update({
+                'status': 'rejected',
+                'needs_reprocess': True,  # Flag for reprocessing
+                'reviewed_by': reviewed_by,
+                'reviewed_at': datetime.utcnow().isoformat()
+            }).in_('id', update_ids).execute)
+            
+            updated = len(result.data)
+            logger.info(f"Rejected {updated} of {len(update_ids)} updates by {reviewed_by} - marked for reprocessing")
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error rejecting updates: {e}")
+            return 0
+
     async def get_system_stats(self) -> Dict:
         """Get overall system statistics"""
         if not self.is_connected():
             return {}
             
         try:
-            # Get total users
-            users_result = self.client.table('users').select('id').execute()
-            total_users = len(users_result.data)
-            
-            # Get memory node statistics
-            nodes_result = self.client.table('memory_nodes').select('status, layer').execute()
-            
-            total_facts = len(nodes_result.data)
-            approved_facts = len([n for n in nodes_result.data if n['status'] == 'approved'])
-            pending_facts = len([n for n in nodes_result.data if n['status'] == 'pending'])
-            rejected_facts = len([n for n in nodes_result.data if n['status'] == 'rejected'])
+            # Users and memory node statistics are independent, so fetch them concurrently
+            users_result, stats_result = await asyncio.gather(
+                self._run(self.client.table('users').select('id', count='exact', head=True).execute),
+                self._run(self.client.rpc('get_system_memory_stats').execute)
+            )
+            total_users = users_result.count or 0
+            
+            # Counts are grouped by status and layer in Postgres
+            counts, layer_distribution = self._tally_memory_stats(stats_result.data)
+            total_facts = sum(layer_distribution.values())
+            approved_facts = counts['approved']
+            pending_facts = counts['pending']
+            rejected_facts = counts['rejected']
             
             # Calculate acceptance rate
             total_reviewed = approved_facts + rejected_facts
             acceptance_rate = (approved_facts / total_reviewed * 100) if total_reviewed > 0 else 0
             
-            # Layer distribution
-            layer_distribution = {}
-            for node in nodes_result.data:
-                layer_key = f"Layer{node['layer']}"
-                if layer_key not in layer_distribution:
-                    layer_distribution[layer_key] = 0
-                layer_distribution[layer_key] += 1
-            
-            return {
+            stats = {
                 'total_users': total_users,
                 'total_facts': total_facts,
                 'approved_facts': approved_facts,
@@ -319,54 +416,53 @@ class SupabaseManager:
                 'acceptance_rate': round(acceptance_rate, 1),
                 'layer_distribution': layer_distribution
             }
+            return stats
             
         except Exception as e:
             logger.error(f"Error getting system stats: {e}")
             return {}
 
     async def get_rejected_items_for_reprocessing(self, limit: int = 50) -> List[Dict]:
-        """Get rejected memory nodes that need reprocessing"""
+        """Get rejected memory nodes that need reprocessing (served by idx_memory_nodes_reprocess, under RLS)"""
         if not self.is_connected():
             return []
             
         try:
-            result = self.client.table('memory_nodes').select('''
-                *,
-                users!inner(phone_number)
-            ''').eq('status', 'rejected').eq('needs_reprocess', True).order('created_at', desc=True).limit(limit).execute()
-            
-            # Format for reprocessing
-            rejected_items = []
-            for node in result.data:
-                rejected_items.append({
-                    'id': node['id'],
-                    'user_id': node['users']['phone_number'],
-                    'layer': node['layer'],
-                    'fact_type': node['fact_type'],
-                    'content': node['content'],
-                    'concluded_fact': node['concluded_fact'],
-                    'confidence': node['confidence'],
-                    'evidence': node.get('evidence', []),
-                    'created_at': node['created_at'],
-                    'rejected_at': node.get('reviewed_at'),
-                    'parent_update_id': node.get('parent_update_id')
-                })
-            
-            return rejected_items
+            # user_id already holds the phone number, so no users join is needed
+            result = await self._run(self.client.table('memory_nodes').select(
+                'id, user_id, layer, fact_type, content, concluded_fact, confidence, evidence, '
+                'created_at, rejected_at:reviewed_at, parent_update_id'
+            ).eq('status', 'rejected').eq('needs_reprocess', True).order('created_at', desc=True).limit(limit).execute)
+            
+            # Columns are aliased server-side, so rows are already in the reprocessing shape
+            return result.data
             
         except Exception as e:
             logger.error(f"Error getting rejected items: {e}")
             return []
 
+    async def get_rejected_node(self, node_id: str) -> Optional[Dict]:
+        """Get a rejected node marked for reprocessing, with its user's phone number"""
+        if not self.is_connected():
+            return None
+            
+        try:
+            result = await self._run(self.client.rpc('get_rejected_node', {'p_node_id': node_id}).execute)
+            return result.data[0] if result.data else None
+            
+        except Exception as e:
+            logger.error(f"Error getting rejected node {node_id}: {e}")
+            return None
+
     async def mark_reprocessing_complete(self, update_id: str) -> bool:
         """Mark a rejected item as reprocessed (no longer needs reprocessing)"""
         if not self.is_connected():
             return False
             
         try:
-            result = self.client.table('memory_nodes').update({
+            result = await self._run(self.client.table('memory_nodes').update({
                 'needs_reprocess': False
-            }).eq('id', update_id).execute()
+            }).eq('id', update_id).execute)
             
             success = len(result.data) > 0
             if success:
@@ -384,24 +480,13 @@ class SupabaseManager:
             return []
             
         try:
-            # Get user
-            user_result = self.client.table('users').select('id').eq('phone_number', user_phone).execute()
-            if not user_result.data:
-                return []
+            # Evidence items are unnested and filtered by message_id in Postgres
+            result = await self._run(self.client.rpc('get_user_evidence_excluding', {
+                'p_user': user_phone,
+                'p_exclude': list(excluded_evidence)
+            }).execute)
             
-            # Get all memory nodes for this user to extract their evidence
-            result = self.client.table('memory_nodes').select('evidence').eq('user_id', user_result.data[0]['id']).execute()
-            
-            all_contexts = []
-            for node in result.data:
-                evidence = node.get('evidence', [])
-                for evidence_item in evidence:
-                    # Only include contexts that don't contain excluded message IDs
-                    message_id = evidence_item.get('message_id')
-                    if message_id and message_id not in excluded_evidence:
-                        all_contexts.append(evidence_item)
-            
-            return all_contexts
+            return result.data
             
         except Exception as e:
             logger.error(f"Error getting user contexts: {e}")
@@ -423,8 +508,14 @@ class SupabaseManager:
         }
         
         try:
-            with open('memory_extractions.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+            if self._fallback_fh is None:
+                self._fallback_fh = open('memory_extractions.log', 'ab', buffering=1 << 16)
+                atexit.register(self._fallback_fh.close)
+            self._fallback_fh.write(orjson.dumps(log_entry) + b'\n')
+            self._fallback_unflushed += 1
+            if self._fallback_unflushed >= FALLBACK_FLUSH_EVERY:
+                self._fallback_fh.flush()
+                self._fallback_unflushed = 0
         except Exception as e:
             logger.error(f"Failed to write fallback log: {e}")
 
@@ -434,8 +525,10 @@ class SupabaseManager:
             return False
             
         try:
-            result = self.client.table('processed_files').select('*').eq('user_id', user_id).execute()
-            return len(result.data) > 0
+            result = await self._run(
+                self.client.table('processed_files').select('user_id', count='exact', head=True).eq('user_id', user_id).execute
+            )
+            return (result.count or 0) > 0
         except Exception as e:
             logger.error(f"Error checking if file processed: {e}")
             return False
@@ -453,10 +546,12 @@ class SupabaseManager:
                 'status': 'completed'
             }
             
-            # Use upsert to handle re-processing scenarios
-            result = self.client.table('processed_files').upsert(data).execute()
+            # Upsert on the user_id key so re-processing updates the row in a single round trip
+            result = await self._run(self.client.table('processed_files').upsert(
+                data, on_conflict='user_id', returning='representation'
+            ).execute)
             
-            if result.data:
+            if result.data and result.data[0]['user_id'] == user_id:
                 logger.info(f"Marked {user_id} as processed with {total_nodes_extracted} nodes")
                 return True
             return False
@@ -470,12 +565,14 @@ class SupabaseManager:
             return False
             
         try:
-            result = self.client.table('processed_files').delete().eq('user_id', user_id).execute()
+            result = await self._run(self.client.table('processed_files').delete().eq('user_id', user_id).execute)
             logger.info(f"Marked {user_id} as unprocessed for reprocessing")
             return True
         except Exception as e:
             logger.error(f"Error marking file as unprocessed: {e}")
             return False
 
-# Global instance
-supabase_manager = SupabaseManager()
\ No newline at end of file
+# Shared instance, created on first use so importing this module doesn't build a client
+@lru_cache(maxsize=1)
+def get_supabase() -> SupabaseManager:
+    return SupabaseManager()
@@ -20,7 +20,7 @@ CREATE TABLE memory_nodes (
     layer INTEGER NOT NULL CHECK (layer IN (1, 2, 3, 4)),
     fact_type VARCHAR(100) NOT NULL,
     content TEXT NOT NULL,
-    concluded_fact TEXT NOT NULL, -- Human readable conclusion like "Phone number of Anurag is +91-xxx"
+    concluded_fact TEXT NOT NULL, -- Human readable conclusion like "Phone number of Anurag is +91-xxx", formatted once at write time
     confidence DECIMAL(3,2) NOT NULL CHECK (confidence >= 0 AND confidence <= 1),
     status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'approved', 'rejected')),
     evidence JSONB NOT NULL DEFAULT '[]', -- Store evidence as JSON array
@@ -33,6 +33,14 @@ CREATE TABLE memory_nodes (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Input files already run through extraction (one row per user file, upserted on user_id)
+CREATE TABLE processed_files (
+    user_id TEXT PRIMARY KEY,
+    processed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    total_nodes_extracted INTEGER NOT NULL DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'completed'
+);
+
 -- Indexes for performance
 CREATE INDEX idx_memory_nodes_user_id ON memory_nodes(user_id);
 CREATE INDEX idx_memory_nodes_layer ON memory_nodes(layer);
@@ -42,25 +50,25 @@ CREATE INDEX idx_memory_nodes_parent_update_id ON memory_nodes(parent_update_id)
 CREATE INDEX idx_memory_nodes_created_at ON memory_nodes(created_at DESC);
 CREATE INDEX idx_users_phone_number ON users(phone_number);
 
+-- Composite and partial indexes matching the API's access patterns
+CREATE INDEX idx_memory_nodes_user_created ON memory_nodes(user_id, created_at DESC);
+CREATE INDEX idx_memory_nodes_pending_created ON memory_nodes(created_at DESC) WHERE status = 'pending';
+CREATE INDEX idx_memory_nodes_pending_layer_created ON memory_nodes(layer, created_at DESC) WHERE status = 'pending';
+CREATE INDEX idx_memory_nodes_reprocess ON memory_nodes(created_at DESC) WHERE status = 'rejected' AND needs_reprocess = TRUE;
+CREATE INDEX idx_memory_nodes_evidence ON memory_nodes USING gin (evidence jsonb_path_ops);
+
 -- Enable Row Level Security (RLS)
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
 ALTER TABLE memory_nodes ENABLE ROW LEVEL SECURITY;
 
--- Policies for authenticated access (adjust based on your auth strategy)
--- For now, allow all operations for authenticated users
-CREATE POLICY "Allow all operations for authenticated users" ON users 
-    FOR ALL USING (auth.role() = 'authenticated');
+-- Policies for authenticated users and the service role (adjust based on your auth strategy)
+-- One permissive policy per table; auth.role() is wrapped in a SELECT so Postgres
+-- evaluates it once per statement (InitPlan) instead of once per row
+CREATE POLICY "Allow authenticated and service role access" ON users 
+    FOR ALL USING ((SELECT auth.role()) IN ('authenticated', 'service_role'));
 
-CREATE POLICY "Allow all operations for authenticated users" ON memory_nodes 
-    FOR ALL USING (auth.role() = 'authenticated');
-
--- Or use service role for backend operations (recommended for your use case)
--- You can also create policies that allow service role access:
-CREATE POLICY "Allow service role full access" ON users 
-    FOR ALL USING (auth.jwt() ->> 'role' = 'service_role');
-
-CREATE POLICY "Allow service role full access" ON memory_nodes 
-    FOR ALL USING (auth.jwt() ->> 'role' = 'service_role');
+CREATE POLICY "Allow authenticated and service role access" ON memory_nodes 
+    FOR ALL USING ((SELECT auth.role()) IN ('authenticated', 'service_role'));
 
 -- Function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -78,6 +86,113 @@ CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
 CREATE TRIGGER update_memory_nodes_updated_at BEFORE UPDATE ON memory_nodes 
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- Rejected node lookup for /api/reprocess/{node_id}: one round trip, joined server-side
+CREATE OR REPLACE FUNCTION get_rejected_node(p_node_id UUID)
+RETURNS TABLE (
+    id UUID,
+    user_id TEXT,
+    phone_number TEXT,
+    layer INTEGER,
+    fact_type VARCHAR,
+    evidence JSONB
+) AS $$
+    SELECT m.id, m.user_id::text, COALESCE(u.phone_number, m.user_id::text), m.layer, m.fact_type, m.evidence
+    FROM memory_nodes m
+    LEFT JOIN users u ON u.id::text = m.user_id::text
+    WHERE m.id = p_node_id AND m.status = 'rejected' AND m.needs_reprocess = TRUE;
+$$ LANGUAGE sql STABLE;
+
+-- Per-user memory summary for /api/users/{id}/summary, aggregated in a single query
+CREATE OR REPLACE FUNCTION fn_user_summary(p_user_id TEXT)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_nodes', COUNT(*),
+        'approved_nodes', COUNT(*) FILTER (WHERE status = 'approved'),
+        'pending_nodes', COUNT(*) FILTER (WHERE status = 'pending'),
+        'rejected_nodes', COUNT(*) FILTER (WHERE status = 'rejected'),
+        'layers', COALESCE((
+            SELECT jsonb_object_agg('Layer' || l.layer, l.cnt)
+            FROM (
+                SELECT layer, COUNT(*) AS cnt FROM memory_nodes
+                WHERE user_id::text = p_user_id GROUP BY layer
+            ) l
+        ), '{}'::jsonb)
+    )
+    FROM memory_nodes
+    WHERE user_id::text = p_user_id;
+$$ LANGUAGE sql STABLE;
+
+-- Distinct users with memory nodes for /api/users (served from idx_memory_nodes_user_id)
+CREATE OR REPLACE FUNCTION get_distinct_memory_users()
+RETURNS SETOF TEXT AS $$
+    SELECT DISTINCT user_id::text FROM memory_nodes;
+$$ LANGUAGE sql STABLE;
+
+-- A user's evidence items, minus those citing excluded message IDs (used when reprocessing)
+CREATE OR REPLACE FUNCTION get_user_evidence_excluding(p_user TEXT, p_exclude TEXT[])
+RETURNS SETOF JSONB AS $$
+    SELECT ev
+    FROM memory_nodes m, jsonb_array_elements(m.evidence) ev
+    WHERE m.user_id::text = p_user
+      AND COALESCE(ev->>'message_id', '') <> ''
+      AND NOT (ev->>'message_id' = ANY(p_exclude));
+$$ LANGUAGE sql STABLE;
+
+-- Status/layer counts for one user, grouped server-side instead of shipping every row
+CREATE OR REPLACE FUNCTION get_user_memory_stats(p_user TEXT)
+RETURNS TABLE (status TEXT, layer INT, cnt BIGINT) AS $$
+    SELECT m.status::text, m.layer, COUNT(*)
+    FROM memory_nodes m
+    WHERE m.user_id::text = p_user
+    GROUP BY m.status, m.layer;
+$$ LANGUAGE sql STABLE;
+
+-- Status/layer counts across all users for /api/stats
+CREATE OR REPLACE FUNCTION get_system_memory_stats()
+RETURNS TABLE (status TEXT, layer INT, cnt BIGINT) AS $$
+    SELECT m.status::text, m.layer, COUNT(*)
+    FROM memory_nodes m
+    GROUP BY m.status, m.layer;
+$$ LANGUAGE sql STABLE;
+
+-- Precomputed reprocessing candidates for /api/reprocess/candidates
+CREATE MATERIALIZED VIEW mv_reprocess_candidates AS
+    SELECT id, user_id, layer, fact_type, content, concluded_fact, confidence, evidence,
+           created_at, reviewed_at, parent_update_id
+    FROM memory_nodes
+    WHERE status = 'rejected' AND needs_reprocess = TRUE;
+
+-- Unique index required for REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX idx_mv_reprocess_candidates_id ON mv_reprocess_candidates(id);
+CREATE INDEX idx_mv_reprocess_candidates_created_at ON mv_reprocess_candidates(created_at DESC);
+
+-- Materialized views bypass RLS, so keep the copied rows away from API callers;
+-- only the asyncpg pool (table owner) reads the view
+REVOKE ALL ON mv_reprocess_candidates FROM anon, authenticated;
+
+CREATE OR REPLACE FUNCTION refresh_reprocess_candidates()
+RETURNS VOID AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_reprocess_candidates;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+REVOKE EXECUTE ON FUNCTION refresh_reprocess_candidates() FROM PUBLIC, anon, authenticated;
+
+-- Signal the API's LISTEN consumer when a node is reviewed, reprocessed or removed;
+-- the refresh itself runs debounced outside the writing transaction
+CREATE OR REPLACE FUNCTION notify_reprocess_candidates()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('reprocess_candidates', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER refresh_reprocess_candidates_on_change
+    AFTER UPDATE OF status, needs_reprocess OR DELETE ON memory_nodes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reprocess_candidates();
+
 -- Sample data for testing (optional)
 -- INSERT INTO users (phone_number, name) VALUES 
 --     ('+91-9876543210', 'Anurag'),
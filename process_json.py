@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 """
 JSON Context Extractor CLI Tool
-Usage: python process_json.py
+Usage: python process_json.py [--batch]
+
+--batch  Extract through the Anthropic Message Batches API (half price, results within 24h)
 """
 
-import json
 import os
+import sys
 import asyncio
+import logging
+import orjson
 from src.preprocessor.json_context_extractor import JSONContextExtractor
 
 async def main():
@@ -20,26 +24,63 @@ async def main():
         "AdityaShetty.json"
     ]
 
-    extractor = JSONContextExtractor()
+    extractor = JSONContextExtractor(use_batch_api="--batch" in sys.argv[1:])
+    # Files belong to different users, so a few can be processed at once
+    max_concurrent_files = 3
+    semaphore = asyncio.Semaphore(max_concurrent_files)
+
+    def load(input_path):
+        with open(input_path, 'rb') as f:
+            return orjson.loads(f.read())
 
+    input_paths = []
     for filename in input_files:
         input_path = os.path.join(input_folder, filename)
-        if not os.path.exists(input_path):
+        if os.path.exists(input_path):
+            input_paths.append(input_path)
+        else:
             print(f"Warning: {input_path} not found, skipping.")
-            continue
 
-        print(f"Processing {input_path}")
-        with open(input_path, 'r', encoding='utf-8') as f:
-            input_data = json.load(f)
+    # Read and parse files ahead of processing in worker threads, keeping only one
+    # file beyond the ones being processed in memory
+    loads = {}
+    unloaded = iter(input_paths)
+
+    def prefetch():
+        input_path = next(unloaded, None)
+        if input_path is None:
+            return False
+        loads[input_path] = asyncio.ensure_future(asyncio.to_thread(load, input_path))
+        return True
+
+    async def process_file(input_path):
+        async with semaphore:
+            print(f"Processing {input_path}")
+            while input_path not in loads and prefetch():
+                pass
+            input_data = await loads.pop(input_path)
+
+            # Extract user_id from filename
+            user_id = os.path.basename(input_path).split(".")[0]
 
-        # Extract user_id from filename
-        user_id = filename.split(".")[0]
+            # Process the JSON and store in DB
+            try:
+                await extractor.process_json(input_data, user_id)
+            finally:
+                # This slot goes to the already-parsed file, so start parsing the one after it
+                prefetch()
+            print(f"Finished processing {input_path}")
 
-        # Process the JSON and store in DB
-        await extractor.process_json(input_data, user_id)
-        print(f"Finished processing {input_path}")
+    for _ in range(max_concurrent_files + 1):
+        prefetch()
+    await asyncio.gather(*(process_file(input_path) for input_path in input_paths))
 
     print("All files processed.")
 
 if __name__ == "__main__":
+    # Surface the extractor's validation and failure logs on the console
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
     asyncio.run(main())
\ No newline at end of file
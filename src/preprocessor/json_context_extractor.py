@@ -1,80 +1,100 @@
-import json
 import re
 import os
 import sys
-from typing import Dict, List, Any
+import asyncio
+import hashlib
+from typing import Dict, List, Any, Optional, Iterable, Iterator
 from collections import defaultdict
-from fuzzywuzzy import fuzz  # For fuzzy deduplication; pip install fuzzywuzzy python-Levenshtein
+from functools import partial, lru_cache
+from pathlib import Path
+from rapidfuzz import fuzz, process  # For fuzzy deduplication; pip install rapidfuzz
+import logging
 import anthropic
+import orjson
 from dotenv import load_dotenv
 
 # Add the project root to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
-from database.supabase_manager import supabase_manager
+from database.supabase_manager import get_supabase
 
 # Load environment variables
 load_dotenv()
 
-class JSONContextExtractor:
-    def __init__(self, chunk_size: int = 100, overlap_size: int = 20):
-        self.chunk_size = chunk_size
-        self.overlap_size = overlap_size
-        
-        # Initialize Anthropic client
-        self.anthropic_client = anthropic.Anthropic(
-            api_key=os.getenv("ANTHROPIC_API_KEY")
-        )
-        
-        # Set default model name
-        self.model_name = "claude-3-5-sonnet-20240620"
-        
-        # Test Supabase connection
-        if not supabase_manager.is_connected():
-            print("⚠️  Supabase connection failed. Operations will be logged only.")
-            self.db_enabled = False
-        else:
-            print("✅ Supabase connection successful.")
-            self.db_enabled = True
+logger = logging.getLogger(__name__)
 
-    def chunk_messages(self, messages: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
-        """Split messages into overlapping chunks for LLM processing"""
-        if not messages:
-            return []
-            
-        chunks = []
-        for i in range(0, len(messages), self.chunk_size - self.overlap_size):
-            chunk = messages[i:i + self.chunk_size]
-            if chunk:
-                chunks.append(chunk)
-            
-            # Stop if we've reached the end
-            if i + self.chunk_size >= len(messages):
-                break
-                
-        return chunks
+# Minimum confidence for an extracted fact to be kept
+CONFIDENCE_THRESHOLD = 0.75
 
-    def deduplicate_messages(self, messages: List[Dict]) -> List[Dict]:
-        """Remove duplicate messages within a context using fuzzy matching"""
-        seen = set()
-        deduped = []
-        for msg in messages:
-            text = msg.get("message", "").strip().lower()
-            if text:
-                is_duplicate = any(fuzz.ratio(text, s) > 95 for s in seen)
-                if not is_duplicate:
-                    seen.add(text)
-                    deduped.append(msg)
-        return deduped
+# Relationship fact types whose value must name someone rather than a bare relation
+RELATIONSHIP_FACT_TYPES = frozenset({'relationship', 'family_member', 'spouse'})
 
-    def prepare_comprehensive_llm_prompt(self, chunk: List[Dict[str, str]], user_id: str) -> str:
-        """Prepare prompt for comprehensive LLM extraction from message chunk with ownership validation"""
-        deduped_chunk = self.deduplicate_messages(chunk)
-        context_text = "\n".join([
-            f"[{msg.get('id', i)}] {msg.get('sender', 'Unknown')}: {msg.get('message', '')}" 
-            for i, msg in enumerate(deduped_chunk)
-        ])
-        
-        prompt = f"""
+# Invalid values that should never be extracted
+INVALID_RELATIONSHIP_VALUES = frozenset({
+    'wife', 'husband', 'nephew', 'niece', 'son', 'daughter', 'brother', 'sister',
+    'mother', 'father', 'aunt', 'uncle', 'cousin', 'friend', 'colleague'
+})
+
+# Invalid evidence snippets that indicate bad extraction
+INVALID_EVIDENCE_PATTERNS = frozenset({
+    'thanks guys', 'thank you', 'thanks', 'ok', 'okay', 'yes', 'no',
+    'sure', 'great', 'perfect', 'sounds good', 'alright'
+})
+
+# Travel fact types that belong in Layer4 rather than Layer1
+TRAVEL_FACT_TYPES = frozenset({'travel_plan', 'flight_number', 'travel_date'})
+
+# Human-readable concluded fact templates by fact type, with ownership emphasis
+FACT_FORMATS = {
+    'phone': "📱 Phone number of {u} is {v}",
+    'phone_number': "📱 Phone number of {u} is {v}",
+    'email': "📧 Email address of {u} is {v}",
+    'address': "🏠 Home address of {u} is {v}",
+    'dob': "🎂 Date of birth of {u} is {v}",
+    'name': "👤 Name of {u} is {v}",
+    'age': "📅 Age of {u} is {v}",
+    'occupation': "💼 Occupation of {u} is {v}",
+    'company': "🏢 Company of {u} is {v}",
+    'relationship_status': "💑 Relationship status of {u} is {v}",
+    'gender': "⚧ Gender of {u} is {v}",
+    'nationality': "🌍 Nationality of {u} is {v}",
+    'document_type': "📄 {u} shared a document of type {v}",
+    'aadhaar_number': "🆔 Aadhaar number of {u} is {v}",
+    'pan_number': "📇 PAN number of {u} is {v}",
+    'family_member': "👨‍👩‍👧‍👦 Family member of {u}: {v}",
+    'friend': "👫 Friend of {u}: {v}",
+    'colleague': "🤝 Colleague of {u}: {v}",
+    'contact_name': "📞 Contact of {u}: {v}",
+    'relationship_type': "💕 {v} of {u}",
+    'food_preference': "🍽️ Food preference of {u}: {v}",
+    'restaurant_preference': "🏪 Preferred restaurant of {u}: {v}",
+    'allergy': "⚠️ {u} is allergic to {v}",
+    'service_provider': "🔧 Service provider of {u}: {v}",
+    'vendor_name': "🛒 Vendor used by {u}: {v}",
+    'habit': "🔄 Personal habit of {u}: {v}",
+    'routine': "📋 Routine of {u}: {v}",
+}
+
+# Maximum concurrent extraction requests to the Anthropic API per event loop
+LLM_CONCURRENCY = 10
+
+# Directory holding validated extraction and deduplication results, one JSON file per prompt hash
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+
+# Longest evidence snippet kept when storing a memory node
+EVIDENCE_SNIPPET_MAX_CHARS = 200
+
+# Longest prefix of a fact value used for fuzzy duplicate scoring
+FUZZY_MATCH_MAX_CHARS = 500
+
+# Rows scored per batched similarity call when deduplicating messages
+DEDUP_BLOCK_SIZE = 512
+
+# Message Batches polling backoff (seconds)
+BATCH_POLL_INITIAL_DELAY = 10
+BATCH_POLL_MAX_DELAY = 300
+
+# Chunk extraction prompt, filled in with the target user and the chunk's message lines
+EXTRACTION_PROMPT_TEMPLATE = """
 You are an expert information extractor for a personal assistant memory system. Extract ONLY personal information that specifically belongs to or is claimed by the target user "{user_id}".
 
 TARGET USER: {user_id}
@@ -200,10 +220,213 @@ REMEMBER: When in doubt about ownership or clarity, DO NOT extract. It's better
 
 Only return valid JSON. If no clearly owned information found for a layer, return empty array for that layer.
 """
-        return prompt
+
+# Layer descriptions used to focus reprocessing prompts
+LAYER_DESCRIPTIONS = {
+    "1": "Basic Personal Information (name, age, address, phone, email, DOB, nationality, gender, blood group, relationship status)",
+    "2": "Information from Documents Shared (Aadhaar card, PAN card, driving license, voter ID, birth certificate, insurance, rent agreement, utility bills)",
+    "3": "Loved Ones & Relations (family members, friends, colleagues, roommates, partners with their names, relationships, and contact details)",
+    "4": "Preferences, Vendors, Standing Instructions (food preferences, favorite restaurants, service providers, vendors, habits, routines, standing orders)"
+}
+
+# Reprocessing prompt for a rejected fact type, filled in with the layer and the chunk's message lines
+REPROCESSING_PROMPT_TEMPLATE = """
+You are reprocessing a REJECTED extraction for a personal assistant memory system. A previous extraction of "{fact_type}" was rejected by reviewers.
+
+LAYER {layer_number}: {layer_description}
+
+SPECIFIC TASK: Find "{fact_type}" information in this conversation chunk with extra care and precision.
+
+CONVERSATION CHUNK:
+{context_text}
+
+INSTRUCTIONS:
+1. Focus ONLY on finding clear, unambiguous "{fact_type}" information
+2. This is a REPROCESSING attempt - be more careful and precise than usual
+3. Look for casual conversational patterns, not just formal statements
+4. Only extract if you find very clear evidence with high confidence (0.8+)
+5. If not found clearly, return empty results
+6. Reference specific message IDs as evidence
+
+RESPONSE FORMAT (JSON only):
+{{
+  "{layer}": [
+    {{
+      "detail": {{"type": "{fact_type}", "value": "extracted_value"}},
+      "confidence": 0.85,
+      "evidence": [
+        {{"message_id": "id", "message_snippet": "relevant_part_of_message"}}
+      ],
+      "timestamp": "2025-09-13 00:00:00"
+    }}
+  ]
+}}
+
+Only return JSON. If no clear "{fact_type}" information is found, return empty array.
+"""
+
+# Patterns for cleaning up and rescuing deduplication responses
+_COMMENT_RE = re.compile(r'(?m)^//.*$')
+_LAYER_RE = re.compile(r'"(Layer\d+)":\s*\[([\s\S]*?)\]')
+
+def _extract_first_json(text: str) -> Optional[str]:
+    """Return the first complete top-level JSON object in text, or None if there isn't one.
+
+    Single pass over the text tracking brace depth, skipping braces inside strings."""
+    start = text.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+@lru_cache(maxsize=4096)
+def _format_concluded_fact(user_id: str, fact_type: str, value: str) -> str:
+    """Format a concluded fact in human-readable form, memoized across repeated facts"""
+    # Use specific template or fallback to generic
+    template = FACT_FORMATS.get(fact_type)
+    if template is None:
+        return f"{fact_type.replace('_', ' ').title()} of {user_id} is {value}"
+    return template.format(u=user_id, v=value)
+
+def _compact_evidence(evidence: List[Dict]) -> List[Dict]:
+    """Drop repeated messages from an evidence list and trim long snippets before storage"""
+    compacted = {}
+    for ev in evidence:
+        message_id = str(ev.get('message_id', 'unknown'))
+        # Evidence without a message ID is only a repeat if the snippet matches too
+        key = (message_id, ev.get('snippet', ev.get('message_snippet'))) if message_id == 'unknown' else message_id
+        if key in compacted:
+            continue
+        ev = dict(ev)
+        for field in ('snippet', 'message_snippet'):
+            if isinstance(ev.get(field), str) and len(ev[field]) > EVIDENCE_SNIPPET_MAX_CHARS:
+                ev[field] = ev[field][:EVIDENCE_SNIPPET_MAX_CHARS]
+        compacted[key] = ev
+    return sorted(compacted.values(), key=lambda ev: str(ev.get('message_id', 'unknown')))
+
+class JSONContextExtractor:
+    def __init__(self, chunk_size: int = 100, overlap_size: int = 20, use_batch_api: bool = False,
+                 cache_enabled: bool = True):
+        self.chunk_size = chunk_size
+        self.overlap_size = overlap_size
+        # Reuse extraction results for prompts seen before (re-runs, identical chunks)
+        self.cache_enabled = cache_enabled
+        self.cache_dir = Path(LLM_CACHE_DIR)
+        # Submit chunk extraction through the Message Batches API (half price, up to 24h latency)
+        self.use_batch_api = use_batch_api
+        
+        # Initialize Anthropic client
+        self.anthropic_client = anthropic.Anthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY")
+        )
+        
+        # Async client and request limiter for concurrent chunk extraction, created
+        # per event loop since both bind to the loop they are first used on
+        self.async_anthropic_client = None
+        self._llm_semaphore = None
+        self._async_client_loop = None
+        
+        # Set default model name
+        self.model_name = "claude-3-5-sonnet-20240620"
+        
+        # Fallback deduplication rules for fact types that need special handling:
+        # phone numbers keep only the highest confidence one, addresses and emails
+        # get contact-specific matching
+        self._fact_type_deduplicators = {
+            'phone_number': self._deduplicate_phone_numbers,
+            'address': partial(self._deduplicate_contact_info, fact_type='address'),
+            'email': partial(self._deduplicate_contact_info, fact_type='email')
+        }
+        
+        # Test Supabase connection
+        if not get_supabase().is_connected():
+            logger.warning("Supabase connection failed. Operations will be logged only.")
+            self.db_enabled = False
+        else:
+            print("✅ Supabase connection successful.")
+            self.db_enabled = True
+
+    def chunk_messages(self, messages: List[Dict[str, str]]) -> Iterator[List[Dict[str, str]]]:
+        """Lazily split messages into overlapping chunks for LLM processing"""
+        # Format each message's prompt line once; overlapping chunks share them
+        for i, msg in enumerate(messages):
+            msg["_formatted"] = f"[{msg.get('id', i)}] {msg.get('sender', 'Unknown')}: {msg.get('message', '')}"
+        
+        step = self.chunk_size - self.overlap_size
+        for i in range(0, len(messages), step):
+            yield messages[i:i + self.chunk_size]
+            
+            # Stop if we've reached the end
+            if i + self.chunk_size >= len(messages):
+                return
+
+    def chunk_count(self, num_messages: int) -> int:
+        """Number of chunks chunk_messages yields for this many messages"""
+        if num_messages <= self.chunk_size:
+            return 1 if num_messages else 0
+        step = self.chunk_size - self.overlap_size
+        return -(-(num_messages - self.chunk_size) // step) + 1
+
+    def deduplicate_messages(self, messages: List[Dict]) -> List[Dict]:
+        """Remove duplicate messages using fuzzy matching"""
+        # Exact repeats of a normalized text (and so re-exported copies of the same
+        # message) always resolve like their first occurrence, so drop them with a
+        # dict lookup before any pairwise scoring
+        seen_texts = set()
+        texts = []
+        candidates = []
+        for msg in messages:
+            text = msg.get("message", "").strip().lower()
+            if text and text not in seen_texts:
+                seen_texts.add(text)
+                texts.append(text)
+                candidates.append(msg)
+        if not texts:
+            return []
+        
+        # A message is a duplicate if it matches any earlier message that was kept
+        # (first seen wins). Only earlier messages matter, so each block of rows is
+        # scored in one batched call against the messages up to it, which keeps the
+        # score matrix bounded for long histories
+        kept = []
+        for start in range(0, len(texts), DEDUP_BLOCK_SIZE):
+            stop = min(start + DEDUP_BLOCK_SIZE, len(texts))
+            scores = process.cdist(texts[start:stop], texts[:stop], scorer=fuzz.ratio, score_cutoff=95)
+            for i in range(start, stop):
+                if not kept or not (scores[i - start, kept] > 95).any():
+                    kept.append(i)
+        return [candidates[i] for i in kept]
+
+    def prepare_comprehensive_llm_prompt(self, chunk: List[Dict[str, str]], user_id: str) -> str:
+        """Prepare prompt for comprehensive LLM extraction from message chunk with ownership validation"""
+        context_text = "\n".join(msg["_formatted"] for msg in chunk)
+        return EXTRACTION_PROMPT_TEMPLATE.format(user_id=user_id, context_text=context_text)
 
     def call_llm_for_extraction(self, prompt: str) -> Dict:
         """Call Claude LLM for information extraction"""
+        cached = self._cache_get(prompt)
+        if cached is not None:
+            return cached
+        
         try:
             response = self.anthropic_client.messages.create(
                 model=self.model_name,
@@ -213,44 +436,149 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
             )
             
             # Extract text content from response
-            response_text = response.content[0].text
+            validated_data = self._parse_extraction_response(response.content[0].text)
+            self._cache_put(prompt, validated_data)
+            return validated_data
+                
+        except Exception as e:
+            logger.error("LLM API error: %s", e)
+            return {}
+
+    def _get_async_client(self) -> anthropic.AsyncAnthropic:
+        """Return the async Anthropic client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_client_loop is not loop:
+            self.async_anthropic_client = anthropic.AsyncAnthropic(
+                api_key=os.getenv("ANTHROPIC_API_KEY")
+            )
+            self._llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+            self._async_client_loop = loop
+        return self.async_anthropic_client
+
+    async def acall_llm_for_extraction(self, prompt: str) -> Dict:
+        """Call Claude LLM for information extraction without blocking the event loop"""
+        cached = self._cache_get(prompt)
+        if cached is not None:
+            return cached
+        
+        client = self._get_async_client()
+        try:
+            async with self._llm_semaphore:
+                response = await client.messages.create(
+                    model=self.model_name,
+                    max_tokens=3000,  # Increased for comprehensive extraction
+                    temperature=0.1,
+                    messages=[{"role": "user", "content": prompt}]
+                )
             
-            # Try to parse JSON response
-            try:
-                raw_data = json.loads(response_text)
-                # Apply validation to filter out bad extractions
-                validated_data = self._validate_extractions(raw_data)
-                return validated_data
-            except json.JSONDecodeError:
-                print(f"Failed to parse LLM response as JSON: {response_text[:200]}...")
-                return {}
+            # Extract text content from response
+            validated_data = self._parse_extraction_response(response.content[0].text)
+            self._cache_put(prompt, validated_data)
+            return validated_data
                 
         except Exception as e:
-            print(f"LLM API error: {e}")
+            logger.error("LLM API error: %s", e)
+            return {}
+
+    async def submit_batch_extraction(self, prompts: Dict[int, str], user_id: str) -> str:
+        """Submit extraction prompts (keyed by chunk index) as one Message Batch and return the batch ID"""
+        client = self._get_async_client()
+        requests = [{
+            "custom_id": f"chunk-{i}",
+            "params": {
+                "model": self.model_name,
+                "max_tokens": 3000,
+                "temperature": 0.1,
+                "messages": [{"role": "user", "content": prompt}]
+            }
+        } for i, prompt in prompts.items()]
+        
+        batch = await client.messages.batches.create(requests=requests)
+        print(f"Submitted extraction batch {batch.id} with {len(requests)} chunks for user {user_id}")
+        return batch.id
+
+    async def collect_batch_extraction(self, batch_id: str, prompts: Dict[int, str]) -> Dict[int, Dict]:
+        """Wait for a Message Batch to end and return validated extractions keyed by chunk index"""
+        client = self._get_async_client()
+        
+        # Poll with exponential backoff until every request has finished
+        delay = BATCH_POLL_INITIAL_DELAY
+        while True:
+            batch = await client.messages.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BATCH_POLL_MAX_DELAY)
+        
+        chunk_results = {i: {} for i in prompts}
+        async for entry in await client.messages.batches.results(batch_id):
+            chunk_index = int(entry.custom_id.split("-", 1)[1])
+            if entry.result.type == "succeeded":
+                validated_data = self._parse_extraction_response(entry.result.message.content[0].text)
+                self._cache_put(prompts[chunk_index], validated_data)
+                chunk_results[chunk_index] = validated_data
+            else:
+                logger.warning("Batch request %s did not succeed: %s", entry.custom_id, entry.result.type)
+        
+        return chunk_results
+
+    def _cache_path(self, prompt: str) -> Path:
+        key = hashlib.sha256(f"{self.model_name}\n{prompt}".encode()).hexdigest()
+        return self.cache_dir / f"{key}.json"
+
+    def _cache_get(self, prompt: str) -> Optional[Dict]:
+        """Return the cached validated LLM result for a prompt, or None on a miss"""
+        if not self.cache_enabled:
+            return None
+        try:
+            with open(self._cache_path(prompt), 'rb') as f:
+                return orjson.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _cache_put(self, prompt: str, validated_data: Dict):
+        """Cache a validated LLM result; empty results (API or parse failures) are not cached"""
+        if not self.cache_enabled or not validated_data:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._cache_path(prompt)
+            # Write then rename so concurrent readers never see a partial file
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(validated_data))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to cache LLM response: %s", e)
+
+    def _parse_extraction_response(self, response_text: str) -> Dict:
+        """Parse and validate the JSON returned by the extraction prompt"""
+        try:
+            raw_data = orjson.loads(response_text.encode())
+            # Apply validation to filter out bad extractions
+            validated_data = self._validate_extractions(raw_data)
+            return validated_data
+        except orjson.JSONDecodeError:
+            logger.warning("Failed to parse LLM response as JSON: %s...", response_text[:200])
             return {}
 
     def _validate_extractions(self, raw_data: Dict) -> Dict:
         """Validate and filter out bad extractions"""
         validated_data = {}
         
-        # Invalid values that should never be extracted
-        invalid_relationship_values = {
-            'wife', 'husband', 'nephew', 'niece', 'son', 'daughter', 'brother', 'sister',
-            'mother', 'father', 'aunt', 'uncle', 'cousin', 'friend', 'colleague'
-        }
-        
-        # Invalid evidence snippets that indicate bad extraction
-        invalid_evidence_patterns = [
-            'thanks guys', 'thank you', 'thanks', 'ok', 'okay', 'yes', 'no',
-            'sure', 'great', 'perfect', 'sounds good', 'alright'
-        ]
-        
         for layer, nodes in raw_data.items():
             validated_nodes = []
             
             for node in nodes:
                 if not isinstance(node, dict) or 'detail' not in node:
                     continue
+                
+                # Check confidence threshold first; nothing else needs looking at for these
+                confidence = node.get('confidence', 0)
+                if confidence < CONFIDENCE_THRESHOLD:
+                    detail = node['detail']
+                    logger.info("Skipping low confidence (%s) extraction: %s = %s", confidence, detail.get('type', ''), detail.get('value', ''))
+                    continue
                     
                 detail = node['detail']
                 fact_type = detail.get('type', '')
@@ -261,33 +589,27 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
                 skip_node = False
                 
                 # Check for invalid relationship extractions
-                if fact_type in ['relationship', 'family_member', 'spouse'] and fact_value in invalid_relationship_values:
-                    print(f"⚠️  Skipping invalid {fact_type}: '{fact_value}' (no specific name)")
+                if fact_type in RELATIONSHIP_FACT_TYPES and fact_value in INVALID_RELATIONSHIP_VALUES:
+                    logger.info("Skipping invalid %s: '%s' (no specific name)", fact_type, fact_value)
                     skip_node = True
                 
                 # Check for invalid evidence snippets
                 for ev in evidence:
                     snippet = ev.get('message_snippet', '').lower().strip()
-                    if snippet in invalid_evidence_patterns:
-                        print(f"⚠️  Skipping extraction from invalid evidence: '{snippet}'")
+                    if snippet in INVALID_EVIDENCE_PATTERNS:
+                        logger.info("Skipping extraction from invalid evidence: '%s'", snippet)
                         skip_node = True
                         break
                 
                 # Check for travel plans in Layer 1
-                if layer == 'Layer1' and fact_type in ['travel_plan', 'flight_number', 'travel_date']:
-                    print(f"⚠️  Moving {fact_type} from Layer1 to Layer4 (travel plans don't belong in basic info)")
+                if layer == 'Layer1' and fact_type in TRAVEL_FACT_TYPES:
+                    logger.info("Moving %s from Layer1 to Layer4 (travel plans don't belong in basic info)", fact_type)
                     # Move to Layer4 instead of rejecting
                     if 'Layer4' not in validated_data:
                         validated_data['Layer4'] = []
                     validated_data['Layer4'].append(node)
                     continue
                 
-                # Check confidence threshold
-                confidence = node.get('confidence', 0)
-                if confidence < 0.75:
-                    print(f"⚠️  Skipping low confidence ({confidence}) extraction: {fact_type} = {fact_value}")
-                    skip_node = True
-                
                 if not skip_node:
                     validated_nodes.append(node)
             
@@ -318,9 +640,7 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
             duplicate_nodes = 0
             low_confidence_rejected = 0
             newly_stored_nodes = {}  # Track only nodes that were actually stored in this iteration
-            
-            # Minimum confidence threshold for ownership validation
-            CONFIDENCE_THRESHOLD = 0.75
+            pending_nodes = []  # (layer, node, row) tuples flushed in one bulk insert
             
             for layer, nodes in extracted_nodes.items():
                 layer_number = int(layer.replace("Layer", ""))
@@ -334,7 +654,7 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
                     # Apply confidence threshold - reject low confidence extractions
                     if confidence < CONFIDENCE_THRESHOLD:
                         low_confidence_rejected += 1
-                        print(f"  ⚠️  Rejected low confidence {detail['type']}: {detail['value']} (confidence: {confidence:.2f})")
+                        logger.info("Rejected low confidence %s: %s (confidence: %.2f)", detail['type'], detail['value'], confidence)
                         continue
                     
                     # Safely extract required fields
@@ -343,37 +663,40 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
                         fact_value = detail.get("value", "N/A")
                         
                         if fact_value == "N/A":
-                            print(f"⚠️  Warning: Missing 'value' field in detail: {detail}")
+                            logger.warning("Missing 'value' field in detail: %s", detail)
                         
                         # Format concluded fact for human readability
                         concluded_fact = self._format_concluded_fact(user_id, fact_type, fact_value)
                         
-                        # Store memory node directly in Supabase
-                        node_id = await supabase_manager.store_memory_node(
-                            user_phone=user_id,
-                            layer=layer_number,
-                            fact_type=fact_type,
-                            content=fact_value,
-                            concluded_fact=concluded_fact,
-                            confidence=confidence,
-                            evidence=evidence
-                        )
-                        
-                        if node_id:
-                            stored_nodes += 1
-                            ownership_reason = node.get('ownership_reason', 'Ownership validated')
-                            print(f"  ✅ Stored {fact_type}: {fact_value} (confidence: {confidence:.2f}) - {ownership_reason}")
-                            # Add to newly stored nodes for this iteration
-                            newly_stored_nodes[layer].append(node)
-                        else:
-                            duplicate_nodes += 1
-                            print(f"  ⚠️  Failed to store {fact_type}: {fact_value}")
+                        # Buffer the row; all rows are inserted together below
+                        pending_nodes.append((layer, node, {
+                            'user_id': user_id,
+                            'layer': layer_number,
+                            'fact_type': fact_type,
+                            'content': fact_value,
+                            'concluded_fact': concluded_fact,
+                            'confidence': confidence,
+                            'evidence': _compact_evidence(evidence)
+                        }))
                             
                     except Exception as detail_error:
-                        print(f"❌ Error processing detail: {str(detail_error)}")
-                        print(f"❌ Detail structure: {detail}")
+                        logger.error("Error processing detail: %s (detail structure: %s)", detail_error, detail)
                         continue  # Skip this detail and continue with next one
             
+            # Store memory nodes in Supabase with one request per batch
+            node_ids = await get_supabase().store_memory_nodes_bulk([row for _, _, row in pending_nodes])
+            
+            for (layer, node, row), node_id in zip(pending_nodes, node_ids):
+                if node_id:
+                    stored_nodes += 1
+                    ownership_reason = node.get('ownership_reason', 'Ownership validated')
+                    logger.debug("Stored %s: %s (confidence: %.2f) - %s", row['fact_type'], row['content'], row['confidence'], ownership_reason)
+                    # Add to newly stored nodes for this iteration
+                    newly_stored_nodes[layer].append(node)
+                else:
+                    duplicate_nodes += 1
+                    logger.warning("Failed to store %s: %s", row['fact_type'], row['content'])
+            
             # Print summary
             print(f"\n📊 Database Summary for {user_id}:")
             print(f"   Stored: {stored_nodes} new nodes")
@@ -381,8 +704,7 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
             print(f"   Rejected (low confidence): {low_confidence_rejected} nodes")
             
             # Get user summary from database
-            import asyncio
-            summary = await supabase_manager.get_user_summary(user_id)
+            summary = await get_supabase().get_user_summary(user_id)
             if summary:
                 print(f"   Total nodes in DB: {summary.get('total_nodes', 0)}")
                 print(f"   By status: Approved={summary.get('approved_nodes', 0)}, Pending={summary.get('pending_nodes', 0)}, Rejected={summary.get('rejected_nodes', 0)}")
@@ -403,7 +725,7 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
             }
             
         except Exception as e:
-            print(f"❌ Database error: {e}")
+            logger.error("Database error: %s", e)
             # Fallback to logging
             print(f"\n=== EXTRACTED DATA FOR USER: {user_id} (DB ERROR FALLBACK) ===")
             for layer, nodes in extracted_nodes.items():
@@ -420,41 +742,8 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
 
     def _format_concluded_fact(self, user_id: str, fact_type: str, value: str) -> str:
         """Format a concluded fact in human-readable form"""
-        
-        # Common fact type mappings with ownership emphasis
-        fact_formatters = {
-            'phone': lambda u, v: f"📱 Phone number of {u} is {v}",
-            'phone_number': lambda u, v: f"📱 Phone number of {u} is {v}",
-            'email': lambda u, v: f"📧 Email address of {u} is {v}",
-            'address': lambda u, v: f"🏠 Home address of {u} is {v}",
-            'dob': lambda u, v: f"🎂 Date of birth of {u} is {v}",
-            'name': lambda u, v: f"👤 Name of {u} is {v}",
-            'age': lambda u, v: f"📅 Age of {u} is {v}",
-            'occupation': lambda u, v: f"💼 Occupation of {u} is {v}",
-            'company': lambda u, v: f"🏢 Company of {u} is {v}",
-            'relationship_status': lambda u, v: f"💑 Relationship status of {u} is {v}",
-            'gender': lambda u, v: f"⚧ Gender of {u} is {v}",
-            'nationality': lambda u, v: f"🌍 Nationality of {u} is {v}",
-            'document_type': lambda u, v: f"📄 {u} shared a document of type {v}",
-            'aadhaar_number': lambda u, v: f"🆔 Aadhaar number of {u} is {v}",
-            'pan_number': lambda u, v: f"📇 PAN number of {u} is {v}",
-            'family_member': lambda u, v: f"👨‍👩‍👧‍👦 Family member of {u}: {v}",
-            'friend': lambda u, v: f"👫 Friend of {u}: {v}",
-            'colleague': lambda u, v: f"🤝 Colleague of {u}: {v}",
-            'contact_name': lambda u, v: f"📞 Contact of {u}: {v}",
-            'relationship_type': lambda u, v: f"💕 {v} of {u}",
-            'food_preference': lambda u, v: f"🍽️ Food preference of {u}: {v}",
-            'restaurant_preference': lambda u, v: f"🏪 Preferred restaurant of {u}: {v}",
-            'allergy': lambda u, v: f"⚠️ {u} is allergic to {v}",
-            'service_provider': lambda u, v: f"🔧 Service provider of {u}: {v}",
-            'vendor_name': lambda u, v: f"🛒 Vendor used by {u}: {v}",
-            'habit': lambda u, v: f"🔄 Personal habit of {u}: {v}",
-            'routine': lambda u, v: f"📋 Routine of {u}: {v}",
-        }
-        
-        # Use specific formatter or fallback to generic
-        formatter = fact_formatters.get(fact_type, lambda u, v: f"{fact_type.replace('_', ' ').title()} of {u} is {v}")
-        return formatter(user_id, value)
+        # Values are formatted as text either way; str() keeps the cache key hashable
+        return _format_concluded_fact(user_id, fact_type, str(value))
 
     def merge_extracted_data(self, all_extracted: List[Dict]) -> Dict:
         """Merge extracted data from multiple chunks, removing duplicates"""
@@ -476,33 +765,49 @@ Only return valid JSON. If no clearly owned information found for a layer, retur
         if not facts:
             return facts
             
-        deduped = []
-        for fact in facts:
-            is_duplicate = False
+        # Only facts of the same type can be duplicates, so compare within per-type
+        # buckets of (position, normalized value, fact); values are normalized once
+        buckets = defaultdict(list)
+        # (type, normalized value) -> index of the bucket entry it was merged into,
+        # so exact repeats (common across overlapping chunks) skip fuzzy scoring
+        exact = {}
+        for position, fact in enumerate(facts):
             fact_type = fact["detail"]["type"]
             fact_value = fact["detail"]["value"].lower().strip()
+            # Long values are compared on their prefix to bound scoring cost
+            match_value = fact_value[:FUZZY_MATCH_MAX_CHARS]
+            bucket = buckets[fact_type]
             
-            for existing in deduped:
-                existing_type = existing["detail"]["type"]
-                existing_value = existing["detail"]["value"].lower().strip()
-                
-                # Same type and high similarity
-                if (fact_type == existing_type and 
-                    fuzz.ratio(fact_value, existing_value) > 85):
-                    is_duplicate = True
-                    # Keep the one with higher confidence
-                    if fact["confidence"] > existing["confidence"]:
-                        deduped.remove(existing)
-                        deduped.append(fact)
-                    break
+            key = (fact_type, fact_value)
+            match = exact.get(key)
+            if match is None:
+                for i, (_, existing_value, _) in enumerate(bucket):
+                    # High similarity (values are already normalized)
+                    if fuzz.ratio(match_value, existing_value, processor=None) > 85:
+                        match = i
+                        break
             
-            if not is_duplicate:
-                deduped.append(fact)
+            if match is None:
+                exact[key] = len(bucket)
+                bucket.append((position, match_value, fact))
+            else:
+                exact[key] = match
+                # Keep the one with higher confidence, replacing the entry in place
+                if fact["confidence"] > bucket[match][2]["confidence"]:
+                    bucket[match] = (position, match_value, fact)
         
-        return deduped
+        # Return facts in the order they were kept, across all types
+        kept = sorted((entry for bucket in buckets.values() for entry in bucket), key=lambda entry: entry[0])
+        return [fact for _, _, fact in kept]
         
     def call_llm_for_deduplication(self, prompt: str) -> Dict:
         """Call LLM specifically for deduplication tasks"""
+        # The prompt embeds the facts, so an unchanged fact set reuses the earlier result
+        cached = self._cache_get(prompt)
+        if cached is not None:
+            print("✅ Using cached deduplication result")
+            return cached
+        
         try:
             response = self.anthropic_client.messages.create(
                 model=self.model_name,
@@ -539,65 +844,51 @@ FORMATTING RULES:
             
             # Extract the response content as text
             if not response or not response.content:
-                print("⚠️ Empty response from LLM")
+                logger.warning("Empty response from LLM")
                 return {}
                 
             content = response.content[0].text
-            print(f"Raw LLM response (first 100 chars): {content[:100]}...")
+            logger.debug("Raw LLM response (first 100 chars): %s...", content[:100])
             
-            # Try multiple methods to extract JSON
-            
-            # Method 1: Try to find JSON in code blocks
-            json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', content)
-            if json_match:
-                json_str = json_match.group(1)
-                print("Found JSON in code block")
+            # Remove comment lines, then take the first balanced JSON object
+            # (works with or without a surrounding code block)
+            content = _COMMENT_RE.sub('', content)
+            json_str = _extract_first_json(content)
+            if json_str is not None:
+                logger.debug("Extracted JSON object (length: %d)", len(json_str))
             else:
-                # Method 2: Find first { and last }
-                first_brace = content.find('{')
-                last_brace = content.rfind('}')
-                
-                if first_brace != -1 and last_brace != -1 and first_brace < last_brace:
-                    json_str = content[first_brace:last_brace+1]
-                    print(f"Extracted JSON using brace matching: chars {first_brace} to {last_brace}")
-                else:
-                    # Method 3: Use the whole response
-                    json_str = content
-                    print("Using full response content for JSON parsing")
-            
-            # Clean up the JSON string
-            json_str = re.sub(r'(?m)^//.*$', '', json_str)  # Remove comment lines
-            json_str = json_str.strip()
+                # Fall back to the whole response
+                json_str = content.strip()
+                logger.debug("Using full response content for JSON parsing")
             
             try:
-                print(f"Attempting to parse JSON (length: {len(json_str)})")
-                result = json.loads(json_str)
-                print("✅ Successfully parsed JSON")
+                logger.debug("Attempting to parse JSON (length: %d)", len(json_str))
+                result = orjson.loads(json_str.encode())
+                logger.debug("Successfully parsed JSON")
+                self._cache_put(prompt, result)
                 return result
-            except json.JSONDecodeError as e:
-                print(f"⚠️ Failed to decode JSON from LLM response: {e}")
-                print(f"JSON string start: {json_str[:200]}...")
-                print(f"JSON string end: ...{json_str[-200:]}")
+            except orjson.JSONDecodeError as e:
+                logger.warning("Failed to decode JSON from LLM response: %s (start: %s... end: ...%s)",
+                               e, json_str[:200], json_str[-200:])
                 
                 # Fallback to raw extraction
                 try:
                     # Attempt to rescue the response using regex
-                    layer_pattern = r'"(Layer\d+)":\s*\[([\s\S]*?)\]'
-                    layers = re.findall(layer_pattern, json_str)
+                    layers = _LAYER_RE.findall(json_str)
                     
                     if layers:
-                        print("🛠️ Attempting fallback regex extraction")
+                        logger.info("Attempting fallback regex extraction")
                         result = {}
                         for layer_name, layer_content in layers:
                             result[layer_name] = []
                         return result
                 except Exception as regex_error:
-                    print(f"Regex fallback failed: {regex_error}")
+                    logger.error("Regex fallback failed: %s", regex_error)
                     
                 return {}
                 
         except Exception as e:
-            print(f"⚠️ Error calling LLM for deduplication: {e}")
+            logger.error("Error calling LLM for deduplication: %s", e)
             return {}
 
     async def deduplicate_with_llm(self, extracted_data: Dict, user_id: str) -> Dict:
@@ -611,6 +902,12 @@ FORMATTING RULES:
         if not extracted_data:
             print(f"No data to deduplicate for user {user_id}")
             return {}
+        
+        # Similar values were already merged chunk-to-chunk, so the LLM can only find
+        # duplicates among facts that share a type within a layer; skip the call if none do
+        if not self._has_duplicate_candidates(extracted_data):
+            print(f"No duplicate candidates for user {user_id}, skipping LLM deduplication")
+            return extracted_data
             
         # Convert extracted data to a format suitable for LLM processing
         facts_by_layer = {}
@@ -678,7 +975,7 @@ RELATIONSHIP FILTERING RULES:
 PHONE NUMBER DEDUPLICATION EXAMPLE:
 These are 3 different phone numbers for the same person. Keep ONLY the highest confidence one: "9870781578" (confidence: 0.95)
 
-Input facts: {json.dumps(facts_by_layer, indent=2)}
+Input facts: {orjson.dumps(facts_by_layer, option=orjson.OPT_INDENT_2).decode()}
 """
 
         try:
@@ -687,76 +984,84 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
             
             # Verify we got a valid response
             if not deduplicated_data:
-                print("⚠️ No valid data from LLM deduplication. Applying fallback deduplication.")
+                logger.warning("No valid data from LLM deduplication. Applying fallback deduplication.")
                 return self._apply_fallback_deduplication(extracted_data, user_id)
                 
             # Verify that we have all the expected layers
-            missing_layers = set(extracted_data.keys()) - set(deduplicated_data.keys())
+            missing_layers = extracted_data.keys() - deduplicated_data.keys()
             if missing_layers:
-                print(f"⚠️ LLM response is missing layers: {missing_layers}. Applying fallback deduplication.")
+                logger.warning("LLM response is missing layers: %s. Applying fallback deduplication.", missing_layers)
                 return self._apply_fallback_deduplication(extracted_data, user_id)
             
             print(f"\n🔍 LLM deduplication complete for {user_id}")
             
+            # Convert back to the original format structure in one pass, skipping malformed facts
+            result = {
+                layer: [node for node in map(self._rebuild_deduplicated_node, facts) if node is not None]
+                for layer, facts in deduplicated_data.items()
+            }
+            
             # Count before/after
-            before_count = sum(len(nodes) for nodes in extracted_data.values())
-            after_count = sum(len(nodes) for nodes in deduplicated_data.values())
+            before_count = sum(map(len, extracted_data.values()))
+            after_count = sum(map(len, result.values()))
             
             # Safety check - if LLM removed all facts, something went wrong
             if after_count == 0 and before_count > 0:
-                print("⚠️ LLM deduplication removed ALL facts! Applying fallback deduplication.")
+                logger.warning("LLM deduplication removed ALL facts! Applying fallback deduplication.")
                 return self._apply_fallback_deduplication(extracted_data, user_id)
                 
             print(f"   Facts before: {before_count}, after: {after_count}, removed: {before_count - after_count}")
             
-            # Convert back to the original format structure
-            result = {}
-            for layer, facts in deduplicated_data.items():
-                result[layer] = []
-                for fact in facts:
-                    # Handle potential missing keys with defaults
-                    if 'type' not in fact or 'value' not in fact:
-                        print(f"⚠️ Skipping malformed fact (missing type/value): {fact}")
-                        continue
-                        
-                    # Reconstruct evidence in the expected format - strictly preserve original snippets
-                    evidence = []
-                    if 'evidence' in fact and isinstance(fact['evidence'], list):
-                        for ev in fact['evidence']:
-                            message_id = ev.get('message_id', 'unknown')
-                            # Handle both 'snippet' and 'message_snippet' from LLM responses
-                            snippet = ev.get('snippet', ev.get('message_snippet', ''))
-                            
-                            # Ensure snippet is preserved exactly as in the original
-                            if not snippet or snippet == "No snippet available":
-                                print(f"⚠️ Warning: Missing or placeholder snippet for message {message_id}")
-                                
-                            evidence.append({
-                                'message_id': message_id,
-                                'snippet': snippet
-                            })
-                    else:
-                        print(f"⚠️ Warning: Missing evidence list in fact: {fact['type']}: {fact['value']}")
-                        # Create minimal evidence to avoid UI errors
-                        evidence = [{'message_id': 'unknown', 'snippet': 'Evidence missing during deduplication'}]
-                    
-                    # Reconstruct node in the expected format
-                    node = {
-                        'detail': {
-                            'type': fact['type'],
-                            'value': fact['value']
-                        },
-                        'confidence': fact.get('confidence', 0.8),  # Default if missing
-                        'evidence': evidence
-                    }
-                    result[layer].append(node)
-            
             return result
         except Exception as e:
-            print(f"⚠️ Error during LLM deduplication: {e}")
-            print("Applying fallback deduplication to ensure duplicates are removed")
+            logger.error("Error during LLM deduplication: %s. Applying fallback deduplication.", e)
             return self._apply_fallback_deduplication(extracted_data, user_id)
 
+    def _rebuild_deduplicated_node(self, fact: Dict) -> Optional[Dict]:
+        """Convert a fact from the deduplication response back to node format, or None if malformed"""
+        # Handle potential missing keys with defaults
+        if 'type' not in fact or 'value' not in fact:
+            logger.warning("Skipping malformed fact (missing type/value): %s", fact)
+            return None
+            
+        # Reconstruct evidence in the expected format - strictly preserve original snippets
+        if 'evidence' in fact and isinstance(fact['evidence'], list):
+            # Handle both 'snippet' and 'message_snippet' from LLM responses
+            evidence = [{
+                'message_id': ev.get('message_id', 'unknown'),
+                'snippet': ev.get('snippet', ev.get('message_snippet', ''))
+            } for ev in fact['evidence']]
+            
+            # Ensure snippets are preserved exactly as in the original
+            for ev in evidence:
+                if not ev['snippet'] or ev['snippet'] == "No snippet available":
+                    logger.warning("Missing or placeholder snippet for message %s", ev['message_id'])
+        else:
+            logger.warning("Missing evidence list in fact: %s: %s", fact['type'], fact['value'])
+            # Create minimal evidence to avoid UI errors
+            evidence = [{'message_id': 'unknown', 'snippet': 'Evidence missing during deduplication'}]
+        
+        # Reconstruct node in the expected format
+        return {
+            'detail': {
+                'type': fact['type'],
+                'value': fact['value']
+            },
+            'confidence': fact.get('confidence', 0.8),  # Default if missing
+            'evidence': evidence
+        }
+
+    def _has_duplicate_candidates(self, extracted_data: Dict) -> bool:
+        """Whether any layer holds more than one fact of the same type"""
+        for nodes in extracted_data.values():
+            seen_types = set()
+            for node in nodes:
+                fact_type = node['detail']['type']
+                if fact_type in seen_types:
+                    return True
+                seen_types.add(fact_type)
+        return False
+
     def _apply_fallback_deduplication(self, extracted_data: Dict, user_id: str) -> Dict:
         """Apply rule-based deduplication when LLM deduplication fails
         
@@ -780,7 +1085,7 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
             total_removed += removed_count
             
             if removed_count > 0:
-                print(f"   {layer}: {len(nodes)} → {len(deduplicated_nodes)} facts (removed {removed_count} duplicates)")
+                logger.debug("%s: %d → %d facts (removed %d duplicates)", layer, len(nodes), len(deduplicated_nodes), removed_count)
         
         before_count = sum(len(nodes) for nodes in extracted_data.values())
         after_count = sum(len(nodes) for nodes in result.values())
@@ -798,26 +1103,14 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
         deduped = []
         
         # Group facts by type for specialized deduplication
-        facts_by_type = {}
+        facts_by_type = defaultdict(list)
         for fact in facts:
-            fact_type = fact['detail']['type']
-            if fact_type not in facts_by_type:
-                facts_by_type[fact_type] = []
-            facts_by_type[fact_type].append(fact)
+            facts_by_type[fact['detail']['type']].append(fact)
         
-        # Apply type-specific deduplication rules
+        # Apply type-specific deduplication rules; other types use standard fuzzy matching
         for fact_type, type_facts in facts_by_type.items():
-            if fact_type == 'phone_number':
-                # For phone numbers: keep only the highest confidence one
-                deduplicated = self._deduplicate_phone_numbers(type_facts)
-            elif fact_type in ['address', 'email']:
-                # For addresses and emails: more sophisticated deduplication
-                deduplicated = self._deduplicate_contact_info(type_facts, fact_type)
-            else:
-                # For other types: use standard fuzzy matching
-                deduplicated = self._deduplicate_facts(type_facts)
-            
-            deduped.extend(deduplicated)
+            deduplicate = self._fact_type_deduplicators.get(fact_type, self._deduplicate_facts)
+            deduped.extend(deduplicate(type_facts))
         
         return deduped
     
@@ -826,13 +1119,10 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
         if not phone_facts:
             return []
         
-        # Sort by confidence (highest first)
-        sorted_phones = sorted(phone_facts, key=lambda x: x['confidence'], reverse=True)
-        
-        # Keep only the highest confidence phone number
-        best_phone = sorted_phones[0]
+        # Keep only the highest confidence phone number (first one on ties)
+        best_phone = max(phone_facts, key=lambda x: x['confidence'])
         
-        print(f"      Phone deduplication: {len(phone_facts)} → 1 (kept highest confidence: {best_phone['detail']['value']})")
+        logger.debug("Phone deduplication: %d → 1 (kept highest confidence: %s)", len(phone_facts), best_phone['detail']['value'])
         
         return [best_phone]
     
@@ -841,89 +1131,128 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
         if not contact_facts:
             return []
         
-        deduped = []
-        
-        for fact in contact_facts:
-            fact_value = fact['detail']['value'].lower().strip()
-            is_duplicate = False
-            
-            for existing in deduped:
-                existing_value = existing['detail']['value'].lower().strip()
-                
-                # For emails: exact match after normalization
-                if fact_type == 'email':
-                    if fact_value == existing_value:
-                        is_duplicate = True
-                        break
-                
-                # For addresses: fuzzy matching
-                elif fact_type == 'address':
-                    if (fact_value == existing_value or 
-                        fuzz.ratio(fact_value, existing_value) > 85):
-                        is_duplicate = True
-                        # Keep the one with higher confidence
-                        if fact["confidence"] > existing["confidence"]:
-                            deduped.remove(existing)
-                            deduped.append(fact)
-                        break
-            
-            if not is_duplicate:
-                deduped.append(fact)
+        if fact_type == 'address':
+            deduped = self._cluster_addresses(contact_facts)
+        else:
+            # For emails: exact match after normalization, keeping the higher confidence one
+            seen = {}
+            for fact in contact_facts:
+                key = fact['detail']['value'].lower().strip()
+                existing = seen.get(key)
+                if existing is None or fact['confidence'] > existing['confidence']:
+                    seen[key] = fact
+            deduped = list(seen.values())
         
         if len(contact_facts) != len(deduped):
-            print(f"      {fact_type} deduplication: {len(contact_facts)} → {len(deduped)}")
+            logger.debug("%s deduplication: %d → %d", fact_type, len(contact_facts), len(deduped))
         
         return deduped
 
+    def _cluster_addresses(self, address_facts: List[Dict]) -> List[Dict]:
+        """Group addresses that fuzzy-match each other and keep the highest confidence one per group"""
+        values = [fact['detail']['value'].lower().strip()[:FUZZY_MATCH_MAX_CHARS] for fact in address_facts]
+        
+        # Score every pair in one batched call, then union addresses linked by a >85 match
+        scores = process.cdist(values, values, scorer=fuzz.ratio, score_cutoff=85)
+        parent = list(range(len(values)))
+        
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        rows, cols = (scores > 85).nonzero()
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            if i < j:
+                parent[find(j)] = find(i)
+        
+        clusters = defaultdict(list)
+        for i in range(len(values)):
+            clusters[find(i)].append(i)
+        
+        # Clusters come out in order of their first address
+        return [address_facts[max(members, key=lambda i: address_facts[i]['confidence'])]
+                for members in clusters.values()]
+
+    def flatten_messages(self, input_json: List[Dict]) -> List[Dict]:
+        """Flatten conversations into one ordered message list tagged with sender and conversation index"""
+        all_messages = []
+        for conv_idx, conv in enumerate(input_json):
+            # Build only the fields used for chunking and prompts rather than copying each message
+            for query in conv.get("user_queries", []):
+                all_messages.append({
+                    "message": query.get("message", ""),
+                    "sender": "User",
+                    "conversation_id": conv_idx,
+                    # Preserve original message_id, use as id for processing
+                    "id": query.get("message_id", f"unknown_user_{conv_idx}")
+                })
+            for reply in conv.get("team_replies", []):
+                all_messages.append({
+                    "message": reply.get("message", ""),
+                    "sender": "Team",
+                    "conversation_id": conv_idx,
+                    "id": reply.get("message_id", f"unknown_team_{conv_idx}")
+                })
+        return all_messages
+
     async def process_json(self, input_json: List[Dict], user_id: str, force_reprocess: bool = False) -> Dict:
         """Process the JSON: chunk messages, call LLM for each chunk, merge and store results"""
         
         # Check if file has already been processed (unless force reprocess)
         if not force_reprocess and self.db_enabled:
-            already_processed = await supabase_manager.is_file_processed(user_id)
+            already_processed = await get_supabase().is_file_processed(user_id)
             if already_processed:
                 print(f"⏭️  {user_id} already processed. Skipping. Use force_reprocess=True to reprocess.")
                 return {"message": "Already processed", "skipped": True}
         
         # Flatten messages, preserving order and adding metadata
-        all_messages = []
-        for conv_idx, conv in enumerate(input_json):
-            for query in conv.get("user_queries", []):
-                query = query.copy()
-                query["sender"] = "User"
-                query["conversation_id"] = conv_idx
-                # Preserve original message_id, use as id for processing
-                query["id"] = query.get("message_id", f"unknown_user_{conv_idx}")
-                all_messages.append(query)
-            for reply in conv.get("team_replies", []):
-                reply = reply.copy()
-                reply["sender"] = "Team"
-                reply["conversation_id"] = conv_idx
-                # Preserve original message_id, use as id for processing
-                reply["id"] = reply.get("message_id", f"unknown_team_{conv_idx}")
-                all_messages.append(reply)
+        all_messages = self.flatten_messages(input_json)
+        
+        # Drop duplicate messages once up front rather than again in every overlapping chunk;
+        # scoring runs in a worker thread (rapidfuzz releases the GIL) so the event loop stays free
+        all_messages = await asyncio.to_thread(self.deduplicate_messages, all_messages)
 
         print(f"Processing {len(all_messages)} messages for user {user_id}")
         
-        # Create chunks for processing
-        chunks = self.chunk_messages(all_messages)
-        print(f"Split into {len(chunks)} chunks (chunk_size={self.chunk_size}, overlap={self.overlap_size})")
+        # Build one prompt per chunk; chunks are produced lazily and not kept around
+        prompts = []
+        chunk_sizes = []
+        extractions = []
+        for chunk in self.chunk_messages(all_messages):
+            chunk_sizes.append(len(chunk))
+            prompt = self.prepare_comprehensive_llm_prompt(chunk, user_id)
+            prompts.append(prompt)
+            if not self.use_batch_api:
+                # Start extracting this chunk (bounded by LLM_CONCURRENCY) while the
+                # following chunks are still being prepared
+                extractions.append(asyncio.ensure_future(self.acall_llm_for_extraction(prompt)))
+                await asyncio.sleep(0)
+        print(f"Split into {len(prompts)} chunks (chunk_size={self.chunk_size}, overlap={self.overlap_size})")
+        
+        if self.use_batch_api:
+            # Offline ingestion: one batch for all uncached chunks at half the token price
+            chunk_results = [self._cache_get(prompt) or {} for prompt in prompts]
+            uncached = {i: prompt for i, prompt in enumerate(prompts) if not chunk_results[i]}
+            if uncached:
+                batch_id = await self.submit_batch_extraction(uncached, user_id)
+                for i, extracted_data in (await self.collect_batch_extraction(batch_id, uncached)).items():
+                    chunk_results[i] = extracted_data
+        else:
+            chunk_results = await asyncio.gather(*extractions)
         
-        # Process each chunk
         all_extracted_data = []
-        for i, chunk in enumerate(chunks):
-            print(f"\nProcessing chunk {i+1}/{len(chunks)} ({len(chunk)} messages)")
-            
-            prompt = self.prepare_comprehensive_llm_prompt(chunk, user_id)
-            extracted_data = self.call_llm_for_extraction(prompt)
+        for i, (chunk_size, extracted_data) in enumerate(zip(chunk_sizes, chunk_results)):
+            logger.debug("Processed chunk %d/%d (%d messages)", i + 1, len(prompts), chunk_size)
             
             if extracted_data:
                 # Count nodes in this chunk
                 total_nodes = sum(len(nodes) for nodes in extracted_data.values() if isinstance(nodes, list))
-                print(f"  Extracted {total_nodes} nodes from chunk {i+1}")
+                logger.debug("Extracted %d nodes from chunk %d", total_nodes, i + 1)
                 all_extracted_data.append(extracted_data)
             else:
-                print(f"  No data extracted from chunk {i+1}")
+                logger.debug("No data extracted from chunk %d", i + 1)
         
         # Merge all extracted data and remove duplicates
         if all_extracted_data:
@@ -942,7 +1271,7 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
                 deduplicated_data = await self.deduplicate_with_llm(merged_data, user_id)
                 print("✅ LLM deduplication completed successfully")
             except Exception as dedup_error:
-                print(f"❌ Error during LLM deduplication: {str(dedup_error)}")
+                logger.error("Error during LLM deduplication: %s", dedup_error)
                 raise dedup_error
             
             # Print deduplication summary
@@ -958,17 +1287,17 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
                 storage_result = await self.store_in_db(deduplicated_data, user_id)
                 print("✅ Database storage completed successfully")
             except Exception as storage_error:
-                print(f"❌ Error during database storage: {str(storage_error)}")
+                logger.error("Error during database storage: %s", storage_error)
                 raise storage_error
             
             # Mark file as processed
             if self.db_enabled:
                 print(f"\n📝 Marking file as processed for user {user_id}...")
                 try:
-                    await supabase_manager.mark_file_processed(user_id, dedup_total_nodes)
+                    await get_supabase().mark_file_processed(user_id, dedup_total_nodes)
                     print("✅ File marked as processed successfully")
                 except Exception as mark_error:
-                    print(f"❌ Error marking file as processed: {str(mark_error)}")
+                    logger.error("Error marking file as processed: %s", mark_error)
                     raise mark_error
             
             # Return only the newly stored facts from this iteration
@@ -981,65 +1310,55 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
             return {}
 
     async def reprocess_rejected_fact(self, user_id: str, fact_type: str, layer: str, 
-                               excluded_message_ids: List[str], original_node_id: str) -> Dict:
+                               excluded_message_ids: Iterable[str], original_node_id: str) -> Dict:
         """Reprocess a specific rejected fact type by re-analyzing with focused prompt"""
         
         # Load the user's JSON file
         input_path = os.path.join("input_jsons", f"{user_id}.json")
         if not os.path.exists(input_path):
-            print(f"Warning: {input_path} not found for reprocessing.")
+            logger.warning("%s not found for reprocessing.", input_path)
             return {}
         
-        with open(input_path, 'r', encoding='utf-8') as f:
-            input_data = json.load(f)
+        with open(input_path, 'rb') as f:
+            input_data = orjson.loads(f.read())
         
-        # Flatten messages, preserving order
-        all_messages = []
-        for conv in input_data:
-            for query in conv.get("user_queries", []):
-                query = query.copy()
-                query["sender"] = "User"
-                # Preserve original message_id, use as id for processing
-                query["id"] = query.get("message_id", "unknown_user")
-                all_messages.append(query)
-            for reply in conv.get("team_replies", []):
-                reply = reply.copy()
-                reply["sender"] = "Team"
-                # Preserve original message_id, use as id for processing
-                reply["id"] = reply.get("message_id", "unknown_team")
-                all_messages.append(reply)
-        
-        # Filter out messages that were used in the original (rejected) extraction
-        filtered_messages = [
-            msg for msg in all_messages 
-            if msg.get("id") not in excluded_message_ids
-        ]
+        # Flatten messages lazily, preserving order, and filter out messages that were
+        # used in the original (rejected) extraction before they are copied; callers may
+        # pass a list, so hash the IDs once for the per-message membership checks
+        excluded = frozenset(excluded_message_ids)
+        filtered_messages = await asyncio.to_thread(
+            self.deduplicate_messages, list(self._iter_reprocessing_messages(input_data, excluded))
+        )
         
         print(f"Reprocessing {fact_type} for {user_id}")
         print(f"Original context had {len(excluded_message_ids)} messages, searching in {len(filtered_messages)} remaining messages")
         
-        # Create chunks from filtered messages
-        chunks = self.chunk_messages(filtered_messages)
-        
         layer_number = layer.split("_")[-1] if "_" in layer else layer.replace("layer", "").replace("Layer", "")
         layer_key = f"Layer{layer_number}"
         extracted_data = {layer_key: []}
         
-        print(f"Processing {len(chunks)} chunks for reprocessing")
+        print(f"Processing {self.chunk_count(len(filtered_messages))} chunks for reprocessing")
         
-        for i, chunk in enumerate(chunks):
-            print(f"  Reprocessing chunk {i+1}: {len(chunk)} messages")
-            
-            # Create a specialized prompt for reprocessing
+        # Create a specialized prompt per chunk and reprocess all chunks concurrently
+        # (bounded by LLM_CONCURRENCY)
+        chunk_sizes = []
+        extractions = []
+        for chunk in self.chunk_messages(filtered_messages):
+            chunk_sizes.append(len(chunk))
             prompt = self.prepare_reprocessing_prompt(chunk, layer_key, fact_type)
-            llm_output = self.call_llm_for_extraction(prompt)
+            extractions.append(asyncio.ensure_future(self.acall_llm_for_extraction(prompt)))
+            await asyncio.sleep(0)
+        chunk_results = await asyncio.gather(*extractions)
+        
+        for i, (chunk_size, llm_output) in enumerate(zip(chunk_sizes, chunk_results)):
+            logger.debug("Reprocessing chunk %d: %d messages", i + 1, chunk_size)
             nodes = llm_output.get(layer_key, [])
             
             if nodes:
-                print(f"    Extracted {len(nodes)} nodes on reprocessing")
+                logger.debug("Extracted %d nodes on reprocessing", len(nodes))
                 extracted_data[layer_key].extend(nodes)
             else:
-                print(f"    No nodes extracted on reprocessing")
+                logger.debug("No nodes extracted on reprocessing")
         
         # Deduplicate the reprocessed results
         if extracted_data[layer_key]:
@@ -1050,57 +1369,31 @@ Input facts: {json.dumps(facts_by_layer, indent=2)}
         
         return extracted_data
 
+    def _iter_reprocessing_messages(self, input_data: List[Dict], excluded_message_ids: frozenset) -> Iterator[Dict]:
+        """Yield flattened messages whose IDs are not excluded from reprocessing"""
+        for conv in input_data:
+            for query in conv.get("user_queries", []):
+                # Preserve original message_id, use as id for processing
+                message_id = query.get("message_id", "unknown_user")
+                if message_id not in excluded_message_ids:
+                    yield {"message": query.get("message", ""), "sender": "User", "id": message_id}
+            for reply in conv.get("team_replies", []):
+                message_id = reply.get("message_id", "unknown_team")
+                if message_id not in excluded_message_ids:
+                    yield {"message": reply.get("message", ""), "sender": "Team", "id": message_id}
+
     def prepare_reprocessing_prompt(self, chunk: List[Dict[str, str]], layer: str, fact_type: str) -> str:
         """Prepare specialized prompt for reprocessing rejected facts"""
-        deduped_chunk = self.deduplicate_messages(chunk)
-        context_text = "\n".join([
-            f"[{msg.get('id', i)}] {msg.get('sender', 'Unknown')}: {msg.get('message', '')}" 
-            for i, msg in enumerate(deduped_chunk)
-        ])
+        context_text = "\n".join(msg["_formatted"] for msg in chunk)
         layer_number = layer.replace("Layer", "")
         
-        layer_descriptions = {
-            "1": "Basic Personal Information (name, age, address, phone, email, DOB, nationality, gender, blood group, relationship status)",
-            "2": "Information from Documents Shared (Aadhaar card, PAN card, driving license, voter ID, birth certificate, insurance, rent agreement, utility bills)",
-            "3": "Loved Ones & Relations (family members, friends, colleagues, roommates, partners with their names, relationships, and contact details)",
-            "4": "Preferences, Vendors, Standing Instructions (food preferences, favorite restaurants, service providers, vendors, habits, routines, standing orders)"
-        }
-        
-        prompt = f"""
-You are reprocessing a REJECTED extraction for a personal assistant memory system. A previous extraction of "{fact_type}" was rejected by reviewers.
-
-LAYER {layer_number}: {layer_descriptions[layer_number]}
-
-SPECIFIC TASK: Find "{fact_type}" information in this conversation chunk with extra care and precision.
-
-CONVERSATION CHUNK:
-{context_text}
-
-INSTRUCTIONS:
-1. Focus ONLY on finding clear, unambiguous "{fact_type}" information
-2. This is a REPROCESSING attempt - be more careful and precise than usual
-3. Look for casual conversational patterns, not just formal statements
-4. Only extract if you find very clear evidence with high confidence (0.8+)
-5. If not found clearly, return empty results
-6. Reference specific message IDs as evidence
-
-RESPONSE FORMAT (JSON only):
-{{
-  "{layer}": [
-    {{
-      "detail": {{"type": "{fact_type}", "value": "extracted_value"}},
-      "confidence": 0.85,
-      "evidence": [
-        {{"message_id": "id", "message_snippet": "relevant_part_of_message"}}
-      ],
-      "timestamp": "2025-09-13 00:00:00"
-    }}
-  ]
-}}
-
-Only return JSON. If no clear "{fact_type}" information is found, return empty array.
-"""
-        return prompt
+        return REPROCESSING_PROMPT_TEMPLATE.format(
+            fact_type=fact_type,
+            layer=layer,
+            layer_number=layer_number,
+            layer_description=LAYER_DESCRIPTIONS[layer_number],
+            context_text=context_text
+        )
 
     async def store_reprocessed_nodes(self, extracted_nodes: Dict, user_id: str, original_node_id: str):
         """Store reprocessed nodes with link to original rejected node"""
@@ -1119,6 +1412,7 @@ Only return JSON. If no clear "{fact_type}" information is found, return empty a
         
         try:
             stored_nodes = 0
+            pending_rows = []
             
             for layer, nodes in extracted_nodes.items():
                 layer_number = int(layer.replace("Layer", ""))
@@ -1134,47 +1428,54 @@ Only return JSON. If no clear "{fact_type}" information is found, return empty a
                         fact_value = detail.get("value", "N/A")
                         
                         if fact_value == "N/A":
-                            print(f"⚠️  Warning: Missing 'value' field in detail: {detail}")
+                            logger.warning("Missing 'value' field in detail: %s", detail)
                     
                         # Format concluded fact for human readability
                         concluded_fact = self._format_concluded_fact(user_id, fact_type, fact_value)
                         
-                        # Store reprocessed memory node with link to original
-                        node_id = await supabase_manager.store_memory_node(
-                            user_phone=user_id,
-                            layer=layer_number,
-                            fact_type=fact_type,
-                            content=fact_value,
-                            concluded_fact=concluded_fact,
-                            confidence=confidence,
-                            evidence=evidence,
-                            extraction_method='reprocess',
-                            parent_update_id=original_node_id
-                        )
-                        
-                        if node_id:
-                            stored_nodes += 1
-                            print(f"  ✅ Stored reprocessed {fact_type}: {fact_value} (Node ID: {node_id})")
-                        else:
-                            print(f"  ⚠️  Failed to store reprocessed {fact_type}: {fact_value}")
+                        # Buffer the reprocessed row, linked to the original; all rows are inserted together below
+                        pending_rows.append({
+                            'user_id': user_id,
+                            'layer': layer_number,
+                            'fact_type': fact_type,
+                            'content': fact_value,
+                            'concluded_fact': concluded_fact,
+                            'confidence': confidence,
+                            'evidence': _compact_evidence(evidence),
+                            'extraction_method': 'reprocess',
+                            'parent_update_id': original_node_id
+                        })
                             
                     except Exception as detail_error:
-                        print(f"❌ Error processing detail: {str(detail_error)}")
-                        print(f"❌ Detail structure: {detail}")
+                        logger.error("Error processing detail: %s (detail structure: %s)", detail_error, detail)
                         continue  # Skip this detail and continue with next one
             
+            # Store reprocessed memory nodes with one request per batch
+            node_ids = await get_supabase().store_memory_nodes_bulk(pending_rows) if pending_rows else []
+            
+            for row, node_id in zip(pending_rows, node_ids):
+                if node_id:
+                    stored_nodes += 1
+                    logger.debug("Stored reprocessed %s: %s (Node ID: %s)", row['fact_type'], row['content'], node_id)
+                else:
+                    logger.warning("Failed to store reprocessed %s: %s", row['fact_type'], row['content'])
+            
             # Mark original node as reprocessed
             if stored_nodes > 0:
-                await supabase_manager.mark_reprocessing_complete(original_node_id)
+                await get_supabase().mark_reprocessing_complete(original_node_id)
                 print(f"\n📊 Reprocessing Summary for {user_id}:")
                 print(f"   Stored: {stored_nodes} reprocessed nodes")
                 print(f"   Linked to original node: {original_node_id}")
             
         except Exception as e:
-            print(f"❌ Database error during reprocessing: {e}")
+            logger.error("Database error during reprocessing: %s", e)
 
     def main(self):
         """Standalone batch processing for all JSON files"""
+        asyncio.run(self.main_async())
+
+    async def main_async(self, max_concurrent_files: int = 3):
+        """Process all JSON files concurrently; LLM calls stay bounded by LLM_CONCURRENCY"""
         input_folder = "input_jsons"
         input_files = [
             "RahulSingh.json",
@@ -1184,26 +1485,50 @@ Only return JSON. If no clear "{fact_type}" information is found, return empty a
             "Anurag.json",
             "AdityaShetty.json"
         ]
+        semaphore = asyncio.Semaphore(max_concurrent_files)
+
+        def load(input_path):
+            with open(input_path, 'rb') as f:
+                return orjson.loads(f.read())
 
+        async def process_file(input_path, user_id):
+            async with semaphore:
+                print(f"Processing {input_path}")
+                input_data = await asyncio.to_thread(load, input_path)
+                await self.process_json(input_data, user_id)
+                print(f"Finished processing {input_path}")
+
+        files = []
         for filename in input_files:
             input_path = os.path.join(input_folder, filename)
             if not os.path.exists(input_path):
                 print(f"Warning: {input_path} not found, skipping.")
                 continue
+            files.append((input_path, filename.split(".")[0]))
 
-            print(f"\n{'='*50}")
-            print(f"Processing {input_path}")
-            print(f"{'='*50}")
-            
-            with open(input_path, 'r', encoding='utf-8') as f:
-                input_data = json.load(f)
+        await asyncio.gather(*(process_file(input_path, user_id) for input_path, user_id in files))
 
-            user_id = filename.split(".")[0]
-            
-            import asyncio
-            asyncio.run(self.process_json(input_data, user_id))
-            print(f"Finished processing {input_path}")
+# Per-process extractor used by process_json_sync inside executor workers
+_worker_extractor = None
+
+def init_extraction_worker():
+    """ProcessPoolExecutor initializer: build the worker's own extractor and clients"""
+    global _worker_extractor
+    _worker_extractor = JSONContextExtractor()
+
+def process_json_sync(input_json: List[Dict], user_id: str, force_reprocess: bool = False) -> Dict:
+    """Run process_json to completion in the calling process.
+
+    Top-level (picklable) entry point for ProcessPoolExecutor workers; each
+    worker reuses the extractor built by init_extraction_worker."""
+    if _worker_extractor is None:
+        init_extraction_worker()
+    return asyncio.run(_worker_extractor.process_json(input_json, user_id, force_reprocess))
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
     extractor = JSONContextExtractor(chunk_size=100, overlap_size=20)  # Configurable chunk sizes
     extractor.main()
\ No newline at end of file